@@ -0,0 +1,146 @@
+"""Single benchmark cases, each of them is run in a fresh interpreter by `run.py`.
+
+Usage: python cases.py <case> <library> <executor>
+
+The environment has to point encarne to the stand-ins and a scratch database.
+The elapsed seconds are printed as JSON on the last line.
+"""
+import io
+import os
+import sys
+import json
+import time
+import contextlib
+import subprocess
+
+from encarne.argument_parser import parser
+from encarne.encoder import Encoder
+from encarne.walker import LibraryWalker
+from encarne.scan_cache import ScanDirectory
+from encarne.movie import MovieIndex
+from encarne.stats import show_stats, clean_movies
+from encarne.db import get_session
+
+
+def get_encoder(library, executor):
+    """Create an encoder for the library like the command line would."""
+    return Encoder(vars(parser.parse_args(['-d', library, '-e', executor, '-j', '8'])))
+
+
+def list_library(library):
+    """Get the paths of all files in the library."""
+    paths = []
+    for directory, _, names in os.walk(library):
+        paths.extend(os.path.join(directory, name) for name in names)
+    return sorted(paths)
+
+
+def start_process(arguments):
+    """Run encarne with the given arguments in a fresh interpreter."""
+    command = [sys.executable, '-c', 'from encarne import main; main()'] + arguments
+    return lambda: subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+
+
+def startup(library, executor):
+    """Start encarne without doing any work, this only measures the imports and argument parsing."""
+    return start_process(['--help'])
+
+
+def scan(library, executor):
+    """Find and probe all files, which need to be encoded, without encoding them."""
+    encoder = get_encoder(library, executor)
+    walker = LibraryWalker(
+        extensions=encoder.get_list('default', 'extensions'),
+        excludes=encoder.get_list('default', 'exclude'),
+        skip_hidden=encoder.config['default'].getboolean('skip-hidden'),
+        listings=ScanDirectory.load(encoder.session, encoder.directory),
+    )
+
+    def run():
+        for _ in encoder.create_tasks(walker.walk(encoder.directory)):
+            pass
+        ScanDirectory.store(encoder.session, encoder.directory, walker.visited)
+
+    return run
+
+
+def movie_index(library, executor):
+    """Create a movie for every file of the library in a directory tree, which doesn't exist."""
+    session = get_session()
+    paths = list_library(library)
+
+    def run():
+        movies = MovieIndex(session)
+        for index, path in enumerate(paths):
+            movies.get_or_create(os.path.basename(path), '/benchmark' + os.path.dirname(path), index,
+                                 fingerprint=f'{index:040d}')
+        movies.commit()
+
+    return run
+
+
+def stat(library, executor):
+    """Aggregate the statistics of all movies."""
+    return lambda: show_stats({'check_files': False, 'by_directory': True, 'json': True})
+
+
+def stat_check_files(library, executor):
+    """Aggregate the statistics of all existing movies."""
+    return lambda: show_stats({'check_files': True, 'by_directory': True, 'json': True})
+
+
+def stat_process(library, executor):
+    """Aggregate the statistics in a new process, like monitoring does."""
+    return start_process(['stat', '--json'])
+
+
+def encode(library, executor):
+    """Scan the library and encode all files by the configured executor."""
+    encoder = get_encoder(library, executor)
+
+    def run():
+        try:
+            encoder.run()
+        except SystemExit:
+            pass
+
+    return run
+
+
+def clean(library, executor):
+    """Remove the movies of every tenth file, which has been deleted."""
+    for path in list_library(library)[::10]:
+        os.remove(path)
+
+    return lambda: clean_movies({})
+
+
+CASES = {
+    'startup': startup,
+    'scan': scan,
+    'rescan': scan,
+    'movie_index': movie_index,
+    'stat': stat,
+    'stat_check_files': stat_check_files,
+    'stat_process': stat_process,
+    'encode': encode,
+    'clean': clean,
+}
+
+
+def main():
+    """Set up and time a single case."""
+    case, library, executor = sys.argv[1:4]
+    run = CASES[case](library, executor)
+
+    # The output of encarne itself isn't interesting.
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+
+    sys.stdout.write(json.dumps({'case': case, 'seconds': seconds}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Benchmark encarne's orchestration on synthetic libraries.
+
+Every library consists of sparse files, which don't occupy any disk space.
+mediainfo, ffmpeg and pueue are replaced by the stand-ins in `stubs`,
+so the benchmark runs offline and only measures encarne itself.
+Each case runs in a fresh interpreter with its own home directory and database.
+
+Usage: python benchmarks/run.py [--sizes 10000 100000] [--save results.json] [--baseline results.json]
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.dirname(BENCHMARK_DIR)
+STUB_DIR = os.path.join(BENCHMARK_DIR, 'stubs')
+
+# The cases in the order they are run on the same library and database.
+CASES = ['startup', 'scan', 'rescan', 'movie_index', 'stat', 'stat_check_files', 'stat_process', 'encode', 'clean']
+
+# Larger than the default `min-size`. Each file gets a unique size and therefore a unique fingerprint.
+FILE_SIZE = 8 * 1024 ** 3
+FILES_PER_DIRECTORY = 100
+
+
+def generate_library(directory, count):
+    """Create a library of sparse movies."""
+    for index in range(count):
+        subdirectory = os.path.join(directory, f'{index // FILES_PER_DIRECTORY:05d}')
+        if index % FILES_PER_DIRECTORY == 0:
+            os.makedirs(subdirectory)
+        path = os.path.join(subdirectory, f'movie.{index:07d}.x264.mkv')
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        os.ftruncate(fd, FILE_SIZE + index)
+        os.close(fd)
+
+
+def run_case(case, library, executor, env):
+    """Run a single case in a new interpreter and get its elapsed seconds."""
+    process = subprocess.run(
+        [sys.executable, os.path.join(BENCHMARK_DIR, 'cases.py'), case, library, executor],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    lines = process.stdout.decode(errors='replace').strip().splitlines()
+    if process.returncode != 0 or len(lines) == 0:
+        sys.stderr.write(f'{case} failed:\n{process.stderr.decode(errors="replace")[-2000:]}\n')
+        return None
+
+    return json.loads(lines[-1])['seconds']
+
+
+def run_size(size, executor, keep):
+    """Run all cases on a new library of the given size."""
+    root = tempfile.mkdtemp(prefix=f'encarne-benchmark-{size}-')
+    library = os.path.join(root, 'library')
+    env = dict(
+        os.environ,
+        HOME=os.path.join(root, 'home'),
+        ENCARNE_DATABASE=os.path.join(root, 'encarne.db'),
+        PATH=os.path.join(STUB_DIR, 'bin') + os.pathsep + os.environ.get('PATH', ''),
+        PYTHONPATH=STUB_DIR + os.pathsep + REPOSITORY_DIR,
+    )
+    os.makedirs(env['HOME'])
+
+    try:
+        sys.stderr.write(f'Generating {size} files in {library}\n')
+        generate_library(library, size)
+
+        results = {}
+        for case in CASES:
+            sys.stderr.write(f'Running {case} with {size} files\n')
+            results[case] = run_case(case, library, executor, env)
+        return results
+    finally:
+        if not keep:
+            shutil.rmtree(root)
+
+
+def format_result(seconds, baseline, threshold):
+    """Format the seconds of a case and their change to the baseline."""
+    if seconds is None:
+        return 'failed'
+
+    result = f'{seconds:.2f}s'
+    if baseline:
+        change = seconds / baseline - 1
+        result += f' ({change:+.0%})'
+        if change > threshold:
+            result += ' REGRESSION'
+    return result
+
+
+def print_table(results, baseline, threshold):
+    """Print the results of all sizes as a markdown table."""
+    sizes = list(results.keys())
+    rows = [['case'] + [f'{size} files' for size in sizes]]
+    for case in CASES:
+        rows.append([case] + [
+            format_result(results[size].get(case), baseline.get(size, {}).get(case), threshold)
+            for size in sizes
+        ])
+
+    widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+    for index, row in enumerate(rows):
+        sys.stdout.write('| ' + ' | '.join(cell.ljust(width) for cell, width in zip(row, widths)) + ' |\n')
+        if index == 0:
+            sys.stdout.write('|' + '|'.join('-' * (width + 2) for width in widths) + '|\n')
+
+
+def main():
+    """Parse the arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description='Benchmark encarne on synthetic libraries.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000],
+                        help='The number of files of each library.')
+    parser.add_argument('--executor', choices=['local', 'pueue'], default='local',
+                        help='The executor of the encode case. pueue uses a stand-in, which runs every command right away.')
+    parser.add_argument('--save', help='Save the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare the results to this JSON file.')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='The relative slowdown, which is reported as regression.')
+    parser.add_argument('--keep', action='store_true', help="Don't remove the libraries and databases.")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = {}
+    for size in args.sizes:
+        results[str(size)] = run_size(size, args.executor, args.keep)
+
+    print_table(results, baseline, args.threshold)
+    if args.save:
+        with open(args.save, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
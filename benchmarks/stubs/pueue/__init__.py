@@ -0,0 +1 @@
+"""Stand-in for the pueue client, which runs every added command right away."""
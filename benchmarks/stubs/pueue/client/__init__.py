@@ -0,0 +1 @@
+"""Stand-in for the parts of the pueue client, which encarne uses."""
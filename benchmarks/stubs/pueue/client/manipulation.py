@@ -0,0 +1,18 @@
+"""Stand-in for pueue's task manipulation."""
+import itertools
+import subprocess
+
+from pueue.client.factories import TASKS, touch_queue
+
+KEYS = itertools.count()
+
+
+def execute_add(args, root_dir=None):
+    """Run the command of a new task and remember its result."""
+    process = subprocess.run(args['command'][0], shell=True, cwd=args['path'])
+    TASKS[next(KEYS)] = {
+        'command': args['command'][0],
+        'path': args['path'],
+        'status': 'done' if process.returncode == 0 else 'failed',
+    }
+    touch_queue(root_dir)
@@ -1,35 +1,45 @@
 #!/bin/env python3
-"""Main file. Encarne entry point."""
-import os
+"""Main file. Encarne entry point.
+
+Only the modules needed by the chosen command are imported, to keep the startup fast.
+"""
 import sys
 import shutil
 
-from pueue.client.factories import command_factory
-
 from encarne.argument_parser import parser
-from encarne.encoder import Encoder
+from encarne.logger import setup_logging
 
 
 def main():
     """Parse args, check if everything is ok and start encarne."""
     args = parser.parse_args()
+    setup_logging()
 
-    # Check if mediainfo is available
-    mediainfo_exists = shutil.which('mediainfo')
-    if not mediainfo_exists:
-        print("Mediainfo needs to be installed on this system.")
-        sys.exit(1)
-
-    # Check if pueue is available:
-    command_factory('status')({}, root_dir=os.path.expanduser('~'))
+    profiler = None
+    if args.profile_output:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
 
     try:
         if hasattr(args, 'func'):
-            args.func(vars(args))
+            from encarne import stats
+            getattr(stats, args.func)(vars(args))
         else:
+            # Check if mediainfo is available
+            mediainfo_exists = shutil.which('mediainfo')
+            if not mediainfo_exists:
+                print("Mediainfo needs to be installed on this system.")
+                sys.exit(1)
+
+            from encarne.encoder import Encoder
             encoder = Encoder(vars(args))
             encoder.run()
 
     except KeyboardInterrupt:
         print('Keyboard interrupt. Shutting down')
         sys.exit(0)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile_output)
@@ -1,6 +1,5 @@
 """Argument parsing."""
 import argparse
-from encarne.stats import show_stats, clean_movies
 
 
 # Specifying commands
@@ -13,6 +12,9 @@ parser.add_argument(
 parser.add_argument(
     '-s', '--size', type=str,
     help='Specify minimun encoding file size (11GB, 100MB, ...).')
+parser.add_argument(
+    '-r', '--rescan', action='store_true',
+    help='Invalidate the scan cache and probe all files again.')
 
 # Encoding stuff
 parser.add_argument(
@@ -39,8 +41,58 @@ parser.add_argument(
     '-t', '--threads', type=int,
     help='The threads used for encoding.')
 
+parser.add_argument(
+    '--segments', type=int,
+    help='Split each movie into this many segments, which are encoded in parallel.')
+
+parser.add_argument(
+    '--segment-length', type=int,
+    help='Split each movie into segments of at most this many seconds. Finished segments survive restarts.')
+
+parser.add_argument(
+    '--samples', type=int,
+    help='Encode this many samples of each movie first and skip movies, which are predicted to not shrink enough.')
+
+parser.add_argument(
+    '-e', '--executor', type=str, choices=['pueue', 'local'],
+    help='The backend, which runs the encoding commands.')
+
+parser.add_argument(
+    '-j', '--jobs', type=int,
+    help='The number of concurrent encodes of the local executor.')
+
+parser.add_argument(
+    '--scratch-dir', type=str,
+    help='The directory, in which movies are encoded before they are moved into the library.')
+
+parser.add_argument(
+    '--staging-dir', type=str,
+    help='Copy upcoming sources to this local directory and encode from there.')
+
+parser.add_argument(
+    '--order', type=str, choices=['savings', 'size', 'path'],
+    help='The order, in which movies are encoded. `savings` prefers the most bytes saved per cpu hour.')
+
+parser.add_argument(
+    '--auto-parallelism', action='store_true',
+    help='Plan parallel encodes and threads per encode by the available cpus and the resolution.')
+
+parser.add_argument(
+    '--profile', action='store_true',
+    help='Print the time spent in each phase of the run and other metrics at the end.')
+
+parser.add_argument(
+    '--profile-output', type=str,
+    help='Profile encarne itself with cProfile and dump the statistics to this file.')
+
+parser.add_argument(
+    '--metrics-file', type=str,
+    help='Write the metrics of each run to this file in the Prometheus text format.')
+
 
 # Initialize supbparser
+# The functions of the subcommands are looked up in `encarne.stats` by their name,
+# so its dependencies are only imported, if a subcommand is run.
 subparsers = parser.add_subparsers(
     title='Subcommands', description='Various client')
 
@@ -49,10 +101,37 @@ subparsers = parser.add_subparsers(
 stat_subcommand = subparsers.add_parser(
     'stat', help='Show some statistics.',
 )
-stat_subcommand.set_defaults(func=show_stats)
+stat_subcommand.add_argument(
+    '--check-files', action='store_true',
+    help="Don't count movies, which don't exist in the file system anymore.")
+stat_subcommand.add_argument(
+    '--by-directory', action='store_true',
+    help='Show the statistics of each directory.')
+stat_subcommand.add_argument(
+    '--json', action='store_true',
+    help='Print the statistics as JSON.')
+stat_subcommand.set_defaults(func='show_stats')
 
 # clean
 clean_subcommand = subparsers.add_parser(
     'clean', help='Check if any movies have been removed.',
 )
-clean_subcommand.set_defaults(func=clean_movies)
+clean_subcommand.set_defaults(func='clean_movies')
+
+# watch
+watch_subcommand = subparsers.add_parser(
+    'watch', help='Keep running and encode new movies, as soon as they appear in the directory.',
+)
+watch_subcommand.add_argument(
+    '--settle-time', type=int,
+    help="Only encode files, whose size and mtime didn't change for this many seconds.")
+watch_subcommand.add_argument(
+    '--reconcile-interval', type=int,
+    help='Scan the whole directory every this many seconds, to find files, whose events got lost.')
+watch_subcommand.set_defaults(watch=True)
+
+# hash
+hash_subcommand = subparsers.add_parser(
+    'hash', help='Compute the full sha1 of all movies, which haven\'t been hashed yet.',
+)
+hash_subcommand.set_defaults(func='hash_movies')
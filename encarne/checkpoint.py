@@ -0,0 +1,39 @@
+"""The sqlite model for a finished segment of an encode."""
+import os
+from sqlalchemy import Column, String, Integer, Text
+
+from encarne.db import base
+
+
+class Checkpoint(base):
+    """A finished segment of a segmented encode.
+
+    Finished segments survive restarts and resets of the executor.
+    Only the unfinished segments of a movie are encoded again.
+    """
+
+    __tablename__ = 'checkpoint'
+
+    path = Column(String(480), primary_key=True)
+    origin_path = Column(String(480), nullable=False, index=True)
+    command = Column(Text(), nullable=False)
+    size = Column(Integer(), nullable=False)
+
+    def __init__(self, path, origin_path, command, size):
+        """Create a new checkpoint."""
+        self.path = path
+        self.origin_path = origin_path
+        self.command = command
+        self.size = size
+
+    def is_valid(self, command):
+        """Check whether the segment has been encoded with this command and is still intact."""
+        try:
+            return self.command == command and os.path.getsize(self.path) == self.size
+        except OSError:
+            return False
+
+    @staticmethod
+    def load(session):
+        """Load all checkpoints into a dict by path."""
+        return {checkpoint.path: checkpoint for checkpoint in session.query(Checkpoint).all()}
@@ -1,23 +1,104 @@
 """Helper class to get a database engine and to get a session."""
-from sqlalchemy import create_engine
+import os
+import time
+from sqlalchemy import create_engine, event, inspect
 from sqlalchemy.orm import scoped_session
-from sqlalchemy.orm.session import sessionmaker
+from sqlalchemy.orm.session import Session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy_utils.functions import database_exists, create_database
 
-engine = create_engine('sqlite:////var/lib/encarne/encarne.db')
+from encarne.metrics import metrics
+
+# The database may be moved by the environment, e.g. for benchmarks.
+DATABASE_PATH = os.environ.get('ENCARNE_DATABASE', '/var/lib/encarne/encarne.db')
+engine = create_engine(f'sqlite:///{DATABASE_PATH}')
 base = declarative_base(bind=engine)
 
 
+@event.listens_for(engine, 'connect')
+def set_sqlite_pragma(connection, connection_record):
+    """Sync less often, which is safe with the write-ahead log enabled by `create_db`."""
+    cursor = connection.cursor()
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+
+@event.listens_for(engine, 'before_cursor_execute')
+def start_statement(connection, cursor, statement, parameters, context, executemany):
+    """Remember the start of a statement for the metrics."""
+    connection.info.setdefault('statement_start', []).append(time.perf_counter())
+
+
+@event.listens_for(engine, 'after_cursor_execute')
+def finish_statement(connection, cursor, statement, parameters, context, executemany):
+    """Count and time all statements."""
+    seconds = time.perf_counter() - connection.info['statement_start'].pop()
+    metrics.count('db_statements')
+    metrics.add_phase('db', seconds)
+    metrics.observe('db_statement_seconds', seconds)
+
+
+@event.listens_for(Session, 'before_commit')
+def start_commit(session):
+    """Remember the start of a commit for the metrics."""
+    session.info['commit_start'] = time.perf_counter()
+
+
+@event.listens_for(Session, 'after_commit')
+def finish_commit(session):
+    """Count and time all commits, including the flush of pending changes."""
+    start = session.info.pop('commit_start', None)
+    if start is not None:
+        metrics.count('db_commits')
+        metrics.add_phase('commit', time.perf_counter() - start)
+
+
 def get_session():
-    """Get a new scoped session."""
-    session = scoped_session(sessionmaker(bind=engine))
+    """Get a new scoped session.
+
+    Objects aren't expired on commit, as encarne is the only writer and
+    keeps large amounts of loaded objects in memory.
+    """
+    session = scoped_session(sessionmaker(bind=engine, expire_on_commit=False))
     return session
 
 
 def create_db():
-    """Create db if it doesn't exist yet."""
-    db_url = engine.url
-    if not database_exists(db_url):
-        create_database(db_url)
-        base.metadata.create_all()
+    """Create db and all missing tables if they don't exist yet.
+
+    SQLite creates the database file on the first connection.
+    Only commands, which write to the database, call this. Switching to the write-ahead log
+    is persistent and readers then need write access to the directory of the database.
+    """
+    base.metadata.create_all()
+    migrate()
+    engine.execute('PRAGMA journal_mode=WAL')
+
+
+def is_migrated():
+    """Check whether all tables and columns exist, without changing the database."""
+    inspector = inspect(engine)
+    tables = inspector.get_table_names()
+    for table in base.metadata.sorted_tables:
+        if table.name not in tables:
+            return False
+        existing = [column['name'] for column in inspector.get_columns(table.name)]
+        if any(column.name not in existing for column in table.columns):
+            return False
+    return True
+
+
+def migrate():
+    """Add columns and indices, which have been added to a model after its table has been created."""
+    inspector = inspect(engine)
+    for table in base.metadata.sorted_tables:
+        existing = [column['name'] for column in inspector.get_columns(table.name)]
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(engine.dialect)
+            engine.execute(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+
+        existing = [index['name'] for index in inspector.get_indexes(table.name)]
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
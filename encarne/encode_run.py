@@ -0,0 +1,52 @@
+"""The sqlite model for a finished encode."""
+from sqlalchemy import Column, String, Float, Integer
+
+from encarne.db import base
+
+
+class EncodeRun(base):
+    """Results and resource usage of a successful encode.
+
+    They are used to estimate future encodes and shown by `encarne stat`.
+    """
+
+    __tablename__ = 'encode_run'
+
+    id = Column(Integer(), primary_key=True)
+    path = Column(String(480), nullable=False)
+    codec = Column(String(40))
+    width = Column(Integer())
+    height = Column(Integer())
+    duration = Column(Float())
+    original_size = Column(Integer(), nullable=False)
+    size = Column(Integer(), nullable=False)
+    # The summed wall time of all encoding processes in seconds.
+    encode_time = Column(Float())
+    threads = Column(Integer())
+    finished = Column(Float())
+    # The time from the start of the first to the end of the last encoding process.
+    wall_time = Column(Float())
+    # The cpu time of all encoding processes in seconds.
+    user_time = Column(Float())
+    system_time = Column(Float())
+    frames = Column(Integer())
+    fps = Column(Float())
+    preset = Column(String(40))
+    crf = Column(String(10))
+    input_bitrate = Column(Integer())
+    output_bitrate = Column(Integer())
+    host = Column(String(240))
+
+    def __init__(self, path, original_size, size):
+        """Create a new encode run."""
+        self.path = path
+        self.original_size = original_size
+        self.size = size
+
+    @staticmethod
+    def load(session, limit=500):
+        """Load the most recent runs."""
+        return session.query(EncodeRun) \
+            .order_by(EncodeRun.id.desc()) \
+            .limit(limit) \
+            .all()
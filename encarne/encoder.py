@@ -2,22 +2,39 @@
 import os
 import sys
 import time
-import glob
+import heapq
+import socket
+import itertools
 import configparser
 import humanfriendly
 
-from pueue.client.manipulation import execute_add
-from pueue.client.factories import command_factory
+from concurrent.futures import ThreadPoolExecutor
 
-from encarne.movie import Movie
+from encarne.movie import MovieIndex
 from encarne.task import Task
+from encarne.checkpoint import Checkpoint
+from encarne.hasher import BackgroundHasher
+from encarne.scratch import get_scratch_dir, move_file
+from encarne.staging import Stager
+from encarne.encode_run import EncodeRun
+from encarne.scoring import SavingsEstimator
+from encarne.sampling import predict_ratio
+from encarne.watchdog import SizeWatchdog
+from encarne.scan_cache import ScanEntry, ScanDirectory
+from encarne.walker import LibraryWalker
+from encarne.monitor import LibraryMonitor
+from encarne.pipeline import bounded_map
+from encarne.watcher import get_poll_interval, MAX_POLL_INTERVAL
+from encarne.executor import PueueExecutor, LocalExecutor
+from encarne.planner import Planner
 from encarne.logger import Logger
-from encarne.db import get_session, create_db
+from encarne.metrics import metrics
+from encarne.db import get_session, create_db, DATABASE_PATH
 from encarne.media import (
     check_file_size,
     check_duration,
-    get_media_encoding,
-    get_sha1,
+    probe_file,
+    get_fingerprint,
 )
 
 
@@ -27,10 +44,9 @@ class Encoder():
     def __init__(self, args):
         """Create a new encoder."""
         # Initialize encarne sql
-        if not os.path.exists('/var/lib/encarne'):
-            os.mkdir('/var/lib/encarne')
-        if not os.path.exists('/var/lib/encarne/encarne.db'):
-            create_db()
+        if not os.path.exists(os.path.dirname(DATABASE_PATH)):
+            os.mkdir(os.path.dirname(DATABASE_PATH))
+        create_db()
         self.session = get_session()
 
         self.initialize_directories()
@@ -38,10 +54,65 @@ class Encoder():
         self.format_args(args)
 
         self.tasks = []
-        self.pueue_status = {}
+        self.checkpoints = Checkpoint.load(self.session)
+        self.planner = None
+        if self.auto_parallelism:
+            self.planner = Planner()
+            self.planner.report()
+        self.executor = self.create_executor()
+        self.hasher = BackgroundHasher(self.session)
+        self.stager = self.create_stager()
+        # Tasks, whose source is being staged.
+        self.staging = []
+        self.watchdog = None
+        if self.config['encoding'].getboolean('watchdog'):
+            self.watchdog = SizeWatchdog(float(self.config['encoding']['watchdog-margin']))
+        # Tasks, whose encode is being predicted by samples.
+        self.predicting = []
+        self.predictor = None
+        if int(self.config['encoding']['samples']) > 0:
+            self.predictor = ThreadPoolExecutor(max_workers=1)
+        # Tasks, which wait for submission by their `order`.
+        self.queue = []
+        self.counter = itertools.count()
+        self.estimator = None
+        if self.config['default']['order'] == 'savings':
+            self.estimator = SavingsEstimator(EncodeRun.load(self.session))
+        # The scan cache and movie index, see `get_index`.
+        self.index = None
+        self.last_check = time.time()
         # Various variables
         self.processed_files = 0
 
+    def create_executor(self):
+        """Create the configured encoding backend."""
+        executor = self.config['default']['executor']
+        if executor == 'local':
+            # Planned encodes occupy one slot per thread.
+            if self.planner is not None:
+                return LocalExecutor(self.session, self.planner.cpus)
+            return LocalExecutor(self.session, int(self.config['default']['jobs']))
+        elif executor == 'pueue':
+            if self.planner is not None:
+                Logger.info("Pueue's parallel setting decides about parallel encodes, "
+                            'only the threads per encode are planned.')
+            return PueueExecutor()
+
+        Logger.warning(f'Unknown executor: {executor}')
+        sys.exit(1)
+
+    def create_stager(self):
+        """Create the stager for sources, if a staging directory is configured."""
+        directory = self.config['default']['staging-dir']
+        if not directory:
+            return None
+
+        return Stager(
+            os.path.abspath(os.path.expanduser(directory)),
+            humanfriendly.parse_size(self.config['default']['staging-size']),
+            int(self.config['default']['prefetch']),
+        )
+
     def initialize_directories(self):
         """Create needed directories."""
         self.directory = None
@@ -60,8 +131,12 @@ class Encoder():
         self.config_path = os.path.join(config_dir, 'encarne.ini')
 
     def read_config(self):
-        """Get the config file or create it with default values."""
+        """Get the config file or create it with default values.
+
+        Missing options of an existing config file fall back to the default values.
+        """
         self.config = configparser.ConfigParser()
+        self.config.read_dict(self.default_config())
 
         # Try to get config, if this doesn't work a new default config will be created
         if os.path.exists(self.config_path):
@@ -70,23 +145,53 @@ class Encoder():
                 return
             except BaseException:
                 Logger.info('Error while parsing config file. Deleting old config')
+                self.config = configparser.ConfigParser()
+                self.config.read_dict(self.default_config())
 
-        # Default configuration
-        self.config['encoding'] = {
-            'crf': '18',
-            'preset': 'slow',
-            'audio': 'None',
-            'kbitrate-audio': 'None',
-            'threads': '4',
-        }
+        self.write_config()
 
-        self.config['default'] = {
-            'min-size': '{0}'.format(1024*1024*1024*6),
-            'SQL_URI': '/var/lib/encarne/encarne.sql',
-            'niceness': '15',
+    def default_config(self):
+        """Get the default configuration."""
+        return {
+            'encoding': {
+                'crf': '18',
+                'preset': 'slow',
+                'audio': 'None',
+                'kbitrate-audio': 'None',
+                'threads': '4',
+                'segments': '1',
+                'segment-length': '0',
+                'samples': '0',
+                'sample-length': '10',
+                'min-saving': '0.1',
+                'watchdog': 'True',
+                'watchdog-margin': '0.1',
+            },
+            'default': {
+                'min-size': '{0}'.format(1024*1024*1024*6),
+                'SQL_URI': '/var/lib/encarne/encarne.sql',
+                'niceness': '15',
+                'probe-workers': '{0}'.format(os.cpu_count() or 1),
+                'extensions': 'mkv,mp4,avi',
+                'exclude': '',
+                'skip-hidden': 'True',
+                'executor': 'pueue',
+                'jobs': '1',
+                'scratch-dir': '',
+                'staging-dir': '',
+                'staging-size': '{0}'.format(1024*1024*1024*100),
+                'prefetch': '3',
+                'order': 'path',
+                'metrics-file': '',
+                'settle-time': '60',
+                'reconcile-interval': '21600',
+            },
         }
 
-        self.write_config()
+    def get_list(self, section, option):
+        """Get a comma separated config option as list."""
+        values = self.config[section][option].split(',')
+        return [value.strip() for value in values if value.strip()]
 
     def write_config(self):
         """Write the config file."""
@@ -98,10 +203,22 @@ class Encoder():
 
     def format_args(self, args):
         """Check arguments and format them to be compatible with `self.config`."""
+        self.rescan = False
+        self.auto_parallelism = False
+        self.profile = False
+        self.watching = False
         args = {key: value for key, value in args.items() if value}
         for key, value in args.items():
             if key == 'directory':
                 self.directory = value
+            elif key == 'rescan':
+                self.rescan = True
+            elif key == 'auto_parallelism':
+                self.auto_parallelism = True
+            elif key == 'profile':
+                self.profile = True
+            elif key == 'watch':
+                self.watching = True
             # Encoding
             if key == 'crf':
                 self.config['encoding']['crf'] = str(value)
@@ -113,6 +230,28 @@ class Encoder():
                 self.config['encoding']['kbitrate-audio'] = value
             elif key == 'threads':
                 self.config['encoding']['threads'] = str(value)
+            elif key == 'segments':
+                self.config['encoding']['segments'] = str(value)
+            elif key == 'samples':
+                self.config['encoding']['samples'] = str(value)
+            elif key == 'segment_length':
+                self.config['encoding']['segment-length'] = str(value)
+            elif key == 'executor':
+                self.config['default']['executor'] = value
+            elif key == 'jobs':
+                self.config['default']['jobs'] = str(value)
+            elif key == 'scratch_dir':
+                self.config['default']['scratch-dir'] = value
+            elif key == 'order':
+                self.config['default']['order'] = value
+            elif key == 'metrics_file':
+                self.config['default']['metrics-file'] = value
+            elif key == 'settle_time':
+                self.config['default']['settle-time'] = str(value)
+            elif key == 'reconcile_interval':
+                self.config['default']['reconcile-interval'] = str(value)
+            elif key == 'staging_dir':
+                self.config['default']['staging-dir'] = value
             elif key == 'size':
                 self.config['default']['min-size'] = str(humanfriendly.parse_size(value))
 
@@ -131,85 +270,391 @@ class Encoder():
             sys.exit(1)
 
     def run(self):
-        """Get all known video files by recursive extension search."""
-        extensions = ['mkv', 'mp4', 'avi']
-        files = []
-        for extension in extensions:
-            found = glob.glob(
-                os.path.join(self.directory, f'**/*.{extension}'),
-                recursive=True)
-            files = files + found
-
-        self.create_tasks(files)
-
-        if len(self.tasks) == 0:
+        """Encode or watch the library and export the metrics of the run, even if it exits early."""
+        try:
+            if self.watching:
+                self.watch_library()
+            else:
+                self.encode_library()
+        finally:
+            self.export_metrics()
+
+    def export_metrics(self):
+        """Print the phase breakdown with `--profile` and write the configured metrics file."""
+        if self.profile:
+            metrics.report()
+        self.write_metrics()
+
+    def write_metrics(self):
+        """Write the metrics to the configured metrics file."""
+        path = self.config['default']['metrics-file']
+        if path:
+            try:
+                metrics.write_textfile(os.path.expanduser(path))
+            except OSError as error:
+                Logger.warning(f'Failed to write metrics to {path}: {error}')
+
+    def encode_library(self):
+        """Find, probe and schedule all video files in a single streaming pass.
+
+        Tasks are sent to the executor as soon as they have been found,
+        while the rest of the library is still being scanned.
+        """
+        self.invalidate_cache()
+        self.executor.refresh()
+        found = self.scan_library()
+        # The index isn't needed anymore, once the library has been scanned.
+        self.index = None
+
+        if found == 0:
             Logger.info('No files for encoding found.')
             sys.exit(0)
         else:
-            Logger.info(f'{len(self.tasks)} files found.')
+            Logger.info(f'{found} files found.')
+
+        while self.is_busy():
+            self.handle_tasks(check=True)
+            if len(self.tasks) > 0 or len(self.staging) > 0 or len(self.predicting) > 0:
+                interval = get_poll_interval(self.tasks)
+                # Predictions and staged sources aren't noticed by the executor.
+                if len(self.staging) > 0 or len(self.predicting) > 0:
+                    interval = min(interval, 1)
+                with metrics.phase('wait'):
+                    self.executor.wait(self.tasks, interval)
+
+        self.hasher.collect(wait=True)
+        Logger.info(f'Successfully encoded {self.processed_files} movies. Exiting')
 
-        self.receive_pueue_status()
-        # Add all tasks to pueue
-        for task in self.tasks:
-            self.add_task(task)
+    def watch_library(self):
+        """Keep running and encode new movies, as soon as they appear in the library.
 
-        while len(self.tasks) > 0:
-            self.receive_pueue_status()
-            # Wait for all tasks
-            remaining_tasks = []
-            for task in self.tasks:
-                if self.is_task_done(task):
-                    self.validate_encoded_file(task)
-                else:
-                    remaining_tasks.append(task)
+        New and changed files are noticed by inotify and scheduled, once they settled.
+        The whole library is scanned at the start, every `reconcile-interval` seconds
+        and whenever events have been lost. Unchanged directories aren't listed again by these scans.
+        """
+        self.invalidate_cache()
+        self.executor.refresh()
+
+        # Watch before the first scan, so no file is missed in between.
+        monitor = LibraryMonitor(self.directory, self.create_walker(),
+                                 float(self.config['default']['settle-time']))
+        Logger.info(f'Watching {len(monitor.directories)} directories')
+        interval = float(self.config['default']['reconcile-interval'])
+        next_scan = time.time()
+
+        while True:
+            if time.time() >= next_scan or monitor.overflowed:
+                monitor.overflowed = False
+                # Pick up changes of other encarne commands, e.g. `encarne clean`.
+                self.index = None
+                found = self.scan_library(monitor)
+                Logger.info(f'Scanned the library, {found} new files found')
+                next_scan = time.time() + interval
+                self.write_metrics()
+
+            settled = monitor.get_settled()
+            if settled:
+                found = self.schedule_files(settled)
+                if found > 0:
+                    Logger.info(f'{found} new files found')
+
+            self.handle_tasks()
+            with metrics.phase('wait'):
+                monitor.wait(1 if self.is_busy() or monitor.pending else MAX_POLL_INTERVAL)
+
+    def invalidate_cache(self):
+        """Invalidate the scan cache of the library with `--rescan`."""
+        if self.rescan:
+            Logger.info('Invalidating scan cache')
+            ScanDirectory.invalidate(self.session, self.directory)
+            ScanEntry.invalidate(self.session, self.directory)
+
+    def create_walker(self):
+        """Create a walker with the remembered listings of the library."""
+        return LibraryWalker(
+            extensions=self.get_list('default', 'extensions'),
+            excludes=self.get_list('default', 'exclude'),
+            skip_hidden=self.config['default'].getboolean('skip-hidden'),
+            listings=ScanDirectory.load(self.session, self.directory),
+        )
+
+    def scan_library(self, monitor=None):
+        """Walk the whole library and schedule all files, which need to be encoded.
+
+        With a `monitor`, files, which are still being written, are left to it.
+        Return the number of scheduled files.
+        """
+        scan_start = time.time()
+        walker = self.create_walker()
+        files = walker.walk(self.directory)
+        if monitor is not None:
+            files = monitor.defer_unsettled(files)
+        found = self.schedule_files(files)
+
+        ScanDirectory.store(self.session, self.directory, walker.visited)
+        Logger.debug(f'Listed {walker.listed} of {len(walker.visited)} directories')
+        metrics.add_phase('scan', time.time() - scan_start)
+        metrics.count('files_found', found)
+        return found
+
+    def schedule_files(self, files):
+        """Create and schedule the tasks of all files, which need to be encoded.
+
+        Files, which already have a task, are skipped.
+        Return the number of scheduled files.
+        """
+        active = {task.origin_path for task in self.tasks + self.staging}
+        active.update(task.origin_path for _, _, task in self.queue)
+        active.update(task.origin_path for task, _ in self.predicting)
+
+        found = 0
+        last_poll = time.time()
+        for task in self.create_tasks(files):
+            if task.origin_path in active:
+                continue
+            active.add(task.origin_path)
+            self.predict_task(task)
+            found += 1
 
-            self.tasks = remaining_tasks
-            time.sleep(60)
+            # Handle finished tasks, while the scan is still running.
+            if time.time() - last_poll >= 1:
+                last_poll = time.time()
+                self.handle_tasks()
 
-        Logger.info(f'Successfully encoded {self.processed_files} movies. Exiting')
+        return found
+
+    def is_busy(self):
+        """Check whether any task hasn't been finished yet."""
+        return len(self.tasks) > 0 or len(self.staging) > 0 or len(self.queue) > 0 or len(self.predicting) > 0
+
+    def handle_tasks(self, check=False):
+        """Submit waiting tasks and check the running ones.
+
+        Running tasks are only checked, if the executor hints at a change,
+        `check` is set or they haven't been checked for `MAX_POLL_INTERVAL` seconds.
+        """
+        self.check_predictions()
+        self.submit_queued_tasks()
+        self.submit_staged_tasks()
+        if check or self.executor.poll(self.tasks) or time.time() - self.last_check > MAX_POLL_INTERVAL:
+            self.check_tasks()
+
+    def check_tasks(self):
+        """Validate all finished tasks and keep the remaining ones."""
+        self.executor.refresh()
+        self.last_check = time.time()
+        metrics.observe('queue_depth', len(self.tasks) + len(self.staging) + len(self.queue) + len(self.predicting))
+        remaining_tasks = []
+        for task in self.tasks:
+            if self.is_task_done(task):
+                with metrics.phase('finalize'):
+                    self.validate_encoded_file(task)
+                # Finished movies have been renamed, the index has to be loaded again.
+                self.index = None
+                self.remove_checkpoints(task)
+                for segment in task.segments:
+                    self.executor.remove(segment.command)
+                self.executor.remove(task.ffmpeg_command)
+                if self.stager is not None:
+                    self.stager.release(task.origin_path)
+            else:
+                remaining_tasks.append(task)
+
+        self.tasks = remaining_tasks
+        self.hasher.collect()
 
     def create_tasks(self, files):
         """Filter files and check if they are already done or failed in a previous run.
 
         Ignore previously failed movies (too big, duration differs) and already encoded movies.
-        Create a task with all paths and the compiled ffmpeg command.
-        """
-        for path in files:
-            # Get absolute path
-            path = os.path.abspath(path)
-            mediainfo = get_media_encoding(path)
+        Yield a task with all paths and the compiled ffmpeg command for each remaining file.
 
-            task = Task(path, self.config)
-            size = os.path.getsize(path)
+        Probe results are cached by device, inode, size and mtime of a file.
+        Unchanged files are neither probed nor hashed again.
+        Uncached files are probed by a pool of `probe-workers` threads, while
+        the database session is only used by this thread.
+        Movies and cache entries are loaded once and reconciled in memory.
 
-            # Get movie from db and check for already encoded or failed files.
-            task.movie = Movie.get_or_create(self.session, task.origin_file,
-                                             task.origin_folder, size)
+        `files` is consumed lazily and only a bounded number of files is probed
+        ahead, so tasks are yielded long before the scan finishes.
+        """
+        cache, movies = self.get_index()
+        workers = max(1, int(self.config['default']['probe-workers']))
 
-            if task.movie.encoded or task.movie.failed:
-                continue
+        def get_entries():
+            for path in files:
+                path = os.path.abspath(path)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entry = ScanEntry.get_or_create(self.session, path, stat, cache)
+                probe = entry.probe
+                yield path, entry, probe, probe is None or entry.fingerprint is None
+
+        def probe_entry(item):
+            path, _, _, unprobed = item
+            if unprobed:
+                return probe_file(path)
+            return None
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for (path, entry, probe, _), result in bounded_map(pool, probe_entry, get_entries(), workers * 4):
+                # Store the probe and fingerprint of unknown files.
+                if result is not None:
+                    probe, entry.fingerprint = result
+                    entry.probe = probe
+                mediainfo = probe.writing_library
+
+                # Get movie from db and check for already encoded or failed files.
+                movie = movies.get_or_create(os.path.basename(path), os.path.dirname(path), entry.size,
+                                             sha1=entry.sha1, fingerprint=entry.fingerprint)
+                entry.sha1 = movie.sha1
+                entry.fingerprint = movie.fingerprint
+
+                if movie.encoded or movie.failed:
+                    continue
+
+                # Already encoded
+                if '265' in mediainfo or '265' in path:
+                    movie.encoded = True
+                    movies.changed()
+                    continue
+                # File to small for encoding
+                elif entry.size < int(self.config['default']['min-size']):
+                    Logger.debug('File smaller than min-size: {path}')
+                    continue
+                # Predicted to not shrink enough
+                elif not self.is_worthwhile(movie):
+                    Logger.debug(f'Encoding {path} is predicted to not be worthwhile')
+                    continue
+                # Unknown encoding
+                elif mediainfo == 'unknown':
+                    Logger.info(f'Failed to get encoding for {path}')
+
+                layout = None
+                if self.planner is not None:
+                    layout = self.planner.plan(probe.width, probe.height)
+
+                # Stage the source, if it fits into the staging directory.
+                source_path = None
+                if self.stager is not None and self.stager.fits(entry.size):
+                    source_path = self.stager.get_path(path)
+
+                scratch_dir = get_scratch_dir(self.get_list('default', 'scratch-dir'), path)
+                task = Task(path, self.config, probe, layout, scratch_dir, source_path)
+                task.movie = movie
+                yield task
+
+        movies.commit()
+
+    def get_index(self):
+        """Get the scan cache and the movie index.
+
+        They are loaded once and kept, until a movie is encoded, so watching doesn't load them for every new file.
+        """
+        if self.index is None:
+            self.index = (ScanEntry.load(self.session), MovieIndex(self.session))
+        return self.index
+
+    def predict_task(self, task):
+        """Predict the size of an encode by samples, before the task is queued."""
+        if self.predictor is None or task.movie.predicted_ratio is not None:
+            self.queue_task(task)
+            return
+
+        self.predicting.append((task, self.predictor.submit(predict_ratio, task, self.config)))
+
+    def check_predictions(self):
+        """Queue the predicted tasks in order, if their encode is worthwhile."""
+        while len(self.predicting) > 0:
+            task, future = self.predicting[0]
+            if not future.done():
+                return
+            self.predicting.pop(0)
 
-            # Already encoded
-            if '265' in mediainfo or '265' in path:
-                task.movie.encoded = True
-                self.session.add(task.movie)
+            ratio = future.result()
+            if ratio is None:
+                self.queue_task(task)
                 continue
-            # File to small for encoding
-            elif size < int(self.config['default']['min-size']):
-                Logger.debug('File smaller than min-size: {path}')
-                continue
-            # Unknown encoding
-            elif mediainfo == 'unknown':
-                Logger.info(f'Failed to get encoding for {path}')
 
-            self.tasks.append(task)
+            task.movie.predicted_ratio = ratio
+            self.session.commit()
+            if self.is_worthwhile(task.movie):
+                self.queue_task(task)
+            else:
+                Logger.info(f'Skipping {task.origin_path}, it is predicted to shrink by only {1 - ratio:.0%}')
 
-        self.session.commit()
+    def is_worthwhile(self, movie):
+        """Check whether the predicted saving of a movie reaches `min-saving`."""
+        if self.predictor is None or movie.predicted_ratio is None:
+            return True
+        return 1 - movie.predicted_ratio >= float(self.config['encoding']['min-saving'])
+
+    def queue_task(self, task):
+        """Queue a task by the configured order.
+
+        With `path` order, tasks are scheduled right away in the order they are found.
+        Otherwise they wait in a priority queue and only a window of tasks is handed to the executor,
+        so the best remaining task is picked, whenever an encode finishes.
+        """
+        order = self.config['default']['order']
+        if order == 'savings':
+            priority = -self.estimator.score(task.probe, task.movie.size)
+        elif order == 'size':
+            priority = -task.movie.size
+        else:
+            self.schedule_task(task)
+            return
+
+        heapq.heappush(self.queue, (priority, next(self.counter), task))
+
+    def submit_queued_tasks(self):
+        """Schedule the best queued tasks, until the window of the executor is full."""
+        window = self.get_window()
+        while len(self.queue) > 0 and len(self.tasks) + len(self.staging) < window:
+            _, _, task = heapq.heappop(self.queue)
+            self.schedule_task(task)
+
+    def get_window(self):
+        """Get the number of ordered tasks, which are handed to the executor at once."""
+        jobs = int(self.config['default']['jobs'])
+        if self.planner is not None:
+            jobs = max(1, self.planner.cpus // Planner.THREADS_BY_HEIGHT[-1][1])
+        return 2 * jobs
+
+    def schedule_task(self, task):
+        """Add a task to the executor or stage its source first."""
+        if task.source_path != task.origin_path:
+            self.stager.add(task.origin_path)
+            self.staging.append(task)
+            return
+
+        self.add_task(task)
+        self.tasks.append(task)
+
+    def submit_staged_tasks(self):
+        """Add all tasks, whose source has been staged, to the executor.
+
+        Tasks are submitted in the order they have been found.
+        If staging failed, the task reads from the original.
+        """
+        while len(self.staging) > 0:
+            task = self.staging[0]
+            state = self.stager.state(task.origin_path)
+            if state == 'queued':
+                return
+            elif state == 'failed':
+                task.set_source(task.origin_path, self.config)
+
+            self.staging.pop(0)
+            self.add_task(task)
+            self.tasks.append(task)
 
     def add_task(self, task):
         """Schedule and manage encoding of a movie.
 
-        2. The command is added to pueue.
+        2. The command is added to the executor.
         3. Wait for the task to finish.
         4. Check if the encoding was successful.
         4.1 If it wasn't successful, we delete the encoded file and mark the
@@ -219,34 +664,67 @@ class Encoder():
 
         """
         # Check if the current command already in the queue.
-        status = self.get_newest_status(task.ffmpeg_command)
-
-        # Send the command to pueue for scheduling, if it isn't in the queue yet
-        if status is None:
-            # In case a previous run failed and pueue has been resetted,
-            # we need to check, if the encoded file is still there.
-            if os.path.exists(task.temp_path):
-                os.remove(task.temp_path)
-
-            # Create a new pueue task
-            args = {
-                'command': [task.ffmpeg_command],
-                'path': task.origin_folder,
-            }
-
-            Logger.info(f'Add task pueue:\n {task.ffmpeg_command}')
-            execute_add(args, os.path.expanduser('~'))
+        status = self.executor.status(task.ffmpeg_command)
+        if status is not None:
+            return
+
+        os.makedirs(os.path.dirname(task.temp_path), exist_ok=True)
+
+        # The segments of a segmented task are scheduled first.
+        # The final command joins them, once all segments are done.
+        # Finished segments of a previous run are kept, lost or failed ones are encoded again.
+        if task.segments:
+            task.prepare_segments()
+            for segment in task.segments:
+                if self.get_segment_status(task, segment) in [None, 'failed']:
+                    task.remove_segment(segment)
+                    self.executor.add(segment.command, task.origin_folder, task.slots)
+            return
+
+        # Send the command to the executor for scheduling, if it isn't in the queue yet
+        # In case a previous run failed and the queue has been resetted,
+        # we need to check, if the encoded file is still there.
+        task.remove_temp_files()
+        self.executor.add(task.ffmpeg_command, task.origin_folder, task.slots)
 
     def is_task_done(self, task):
-        """Wait for the pueue task to finish."""
-        # Get index of current command and the current status
-        status = self.get_newest_status(task.ffmpeg_command)
+        """Check whether the job of a task has finished."""
+        status = self.executor.status(task.ffmpeg_command)
+
+        # Abort encodes, which are projected to be clearly larger than the original.
+        if status != 'done' and self.watchdog is not None \
+                and self.watchdog.is_oversized(task, task.movie.original_size):
+            Logger.warning(f'Aborting {task.origin_file}, it is projected to be larger than the original')
+            for segment in task.segments:
+                self.executor.kill(segment.command)
+            self.executor.kill(task.ffmpeg_command)
+            task.remove_temp_files()
+            task.movie.failed = True
+            return True
+
+        # Join the segments, once all of them are done.
+        if status is None and task.segments:
+            statuses = [self.get_segment_status(task, segment) for segment in task.segments]
+            if all(segment_status == 'done' for segment_status in statuses):
+                task.remove_output()
+                self.executor.add(task.ffmpeg_command, task.origin_folder)
+                return False
+            elif 'failed' in statuses:
+                status = 'failed'
+            else:
+                # Segments, which the executor lost, e.g. by a reset, are encoded again.
+                # Checkpointed segments are kept.
+                for segment, segment_status in zip(task.segments, statuses):
+                    if segment_status is None:
+                        Logger.info(f'Segment {segment.path} has been lost, encoding it again')
+                        task.remove_segment(segment)
+                        self.executor.add(segment.command, task.origin_folder, task.slots)
+                return False
 
         # If the command has been removed or failed,
         # remove the already created destination file.
         if status is None or status == 'failed':
-            if os.path.exists(task.temp_path):
-                os.remove(task.temp_path)
+            task.remove_temp_files()
             task.movie.failed = True
             return True
 
@@ -256,13 +734,85 @@ class Encoder():
 
         return False
 
+    def get_segment_status(self, task, segment):
+        """Get the status of a segment.
+
+        Segments, which are done, are checkpointed in the database.
+        A valid checkpoint makes the segment done, no matter what the executor knows.
+        """
+        checkpoint = self.checkpoints.get(segment.path)
+        if checkpoint is not None:
+            if checkpoint.is_valid(segment.command):
+                return 'done'
+            del self.checkpoints[segment.path]
+            self.session.delete(checkpoint)
+            self.session.commit()
+
+        status = self.executor.status(segment.command)
+        if status == 'done':
+            if not os.path.exists(segment.path):
+                return None
+            checkpoint = Checkpoint(segment.path, task.origin_path, segment.command,
+                                    os.path.getsize(segment.path))
+            self.checkpoints[segment.path] = checkpoint
+            self.session.add(checkpoint)
+            self.session.commit()
+
+        return status
+
+    def remove_checkpoints(self, task):
+        """Remove the checkpoints of all segments of a task."""
+        for segment in task.segments:
+            checkpoint = self.checkpoints.pop(segment.path, None)
+            if checkpoint is not None:
+                self.session.delete(checkpoint)
+        self.session.commit()
+
+    def record_run(self, task, original_size):
+        """Remember the results of a successful encode for future estimates."""
+        run = EncodeRun(task.target_path, original_size, task.movie.size)
+        if task.probe is not None:
+            run.codec = task.probe.codec
+            run.width = task.probe.width
+            run.height = task.probe.height
+            if task.probe.duration is not None:
+                run.duration = task.probe.duration.total_seconds()
+        run.encode_time = task.encode_time
+        run.threads = task.layout.threads if task.layout is not None else int(self.config['encoding']['threads'])
+        run.finished = time.time()
+        run.preset = self.config['encoding']['preset']
+        run.crf = self.config['encoding']['crf']
+        run.host = socket.gethostname()
+
+        run.frames = task.frames
+        if run.frames and run.encode_time:
+            run.fps = run.frames / run.encode_time
+        if run.duration:
+            run.input_bitrate = int(original_size * 8 / run.duration)
+            run.output_bitrate = int(run.size * 8 / run.duration)
+
+        # The resource usage of all jobs of this task, as far as the executor knows it.
+        commands = [segment.command for segment in task.segments] + [task.ffmpeg_command]
+        usages = [self.executor.usage(command) for command in commands]
+        if None not in usages:
+            started = [usage[0] for usage in usages]
+            finished = [usage[1] for usage in usages]
+            if None not in started and None not in finished:
+                run.wall_time = max(finished) - min(started)
+            if all(usage[2] is not None and usage[3] is not None for usage in usages):
+                run.user_time = sum(usage[2] for usage in usages)
+                run.system_time = sum(usage[3] for usage in usages)
+        self.session.add(run)
+        self.session.commit()
+
     def validate_encoded_file(self, task):
         """Validate that the encoded file is not malformed."""
         if os.path.exists(task.temp_path):
-            Logger.info("Pueue task completed:")
+            Logger.info("Encoding task completed:")
             Logger.info(task.origin_file)
             # Check if the duration of both movies differs.
-            copy, delete = check_duration(task.origin_path, task.temp_path, seconds=1)
+            copy, delete = check_duration(task.origin_path, task.temp_path, seconds=1,
+                                          origin_duration=task.probe.duration)
 
             # Check if the filesize of the x.265 encoded object is bigger
             # than the original.
@@ -271,8 +821,10 @@ class Encoder():
 
             # Only copy if checks above passed
             if copy:
-                # Save new path, size, sha1 and mark as encoded
-                task.movie.sha1 = get_sha1(task.temp_path)
+                # Save new path, size, fingerprint and mark as encoded.
+                # The sha1 is computed in the background, once the file is in place.
+                task.movie.sha1 = None
+                task.movie.fingerprint = get_fingerprint(task.temp_path)
                 task.movie.size = os.path.getsize(task.temp_path)
                 task.movie.encoded = True
                 task.movie.name = os.path.basename(task.target_path)
@@ -283,17 +835,16 @@ class Encoder():
                 # Get original file permissions
                 stat = os.stat(task.origin_path)
 
-                # Remove the old file and copy the new one to the proper directory.
-                os.remove(task.origin_path)
-                os.rename(task.temp_path, task.target_path)
-                # Set original file permissions on new file.
-                os.chmod(task.target_path, stat.st_mode)
-                try:
-                    os.chown(task.target_path, stat.st_uid, stat.st_gid)
-                except PermissionError:
-                    Logger.info("Failed to set ownership for {0}".format(task.target_path))
-                    pass
+                # Move the new file to the proper directory with the original file permissions.
+                # The old file is only removed, once the new one is in place.
+                move_file(task.temp_path, task.target_path, stat)
+                if task.target_path != task.origin_path:
+                    os.remove(task.origin_path)
+                self.record_run(task, stat.st_size)
+                task.remove_temp_files()
+                self.hasher.add(task.movie, task.target_path)
                 self.processed_files += 1
+                metrics.count('movies_encoded')
                 Logger.info("New encoded file is now in place")
             elif delete:
                 # Mark as failed and save
@@ -301,23 +852,8 @@ class Encoder():
                 self.session.add(task.movie)
                 self.session.commit()
 
-                os.remove(task.temp_path)
+                task.remove_temp_files()
                 Logger.warning("Didn't copy new file, see message above")
         else:
-            Logger.error("Pueue task failed in some kind of way.")
-
-    def get_newest_status(self, command):
-        """Get the status and key of the given process in pueue."""
-        if isinstance(self.pueue_status['data'], dict):
-            # Get the status of the latest submitted job, with this command.
-            highest_key = None
-            for key, value in self.pueue_status['data'].items():
-                if value['command'] == command:
-                    if highest_key is None or highest_key < key:
-                        highest_key = key
-            if highest_key is not None:
-                return self.pueue_status['data'][highest_key]['status']
-        return None
-
-    def receive_pueue_status(self):
-        self.pueue_status = command_factory('status')({}, root_dir=os.path.expanduser('~'))
+            task.remove_temp_files()
+            Logger.error("Encoding task failed in some kind of way.")
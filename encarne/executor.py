@@ -0,0 +1,420 @@
+"""Backends, which run the encoding commands."""
+import os
+import time
+import shlex
+import signal
+import tempfile
+import threading
+import subprocess
+from collections import deque
+
+from encarne.job import Job
+from encarne.logger import Logger
+from encarne.metrics import metrics
+from encarne.progress import read_progress, is_finished
+from encarne.watcher import CompletionWatcher
+
+
+class Executor():
+    """Interface of an encoding backend.
+
+    Jobs are identified by their command.
+    The status of a job is `None`, if it is unknown to the backend, otherwise
+    one of `queued`, `running`, `done` or `failed`.
+    """
+
+    def refresh(self):
+        """Update the status of all jobs."""
+        raise NotImplementedError
+
+    def status(self, command):
+        """Get the status of the newest job with this command, as of the last refresh."""
+        raise NotImplementedError
+
+    def add(self, command, path, slots=1):
+        """Schedule a command, which will be executed in `path`.
+
+        `slots` is the number of cpus, which the command will keep busy.
+        """
+        raise NotImplementedError
+
+    def remove(self, command):
+        """Forget about all finished jobs with this command."""
+
+    def kill(self, command):
+        """Stop the queued or running jobs with this command."""
+        raise NotImplementedError
+
+    def usage(self, command):
+        """Get the resource usage of the finished job with this command.
+
+        Return a tuple of start time, finish time, user and system cpu seconds.
+        Unknown values are `None`, the whole usage is `None` for backends, which don't track it.
+        """
+        return None
+
+    def poll(self, tasks):
+        """Check whether any job might have changed since the last refresh."""
+        raise NotImplementedError
+
+    def wait(self, tasks, timeout):
+        """Wait until any job might have finished or the timeout is reached."""
+        raise NotImplementedError
+
+
+class PueueExecutor(Executor):
+    """Schedule commands with the pueue daemon."""
+
+    def __init__(self):
+        """Check if pueue is available."""
+        self.root_dir = os.path.expanduser('~')
+        self.watcher = CompletionWatcher(os.path.join(self.root_dir, '.config/pueue/queue'))
+        self.pueue_status = {}
+        self.refresh()
+
+    def refresh(self):
+        """Receive the status of all pueue tasks."""
+        from pueue.client.factories import command_factory
+        with metrics.phase('executor'):
+            self.pueue_status = command_factory('status')({}, root_dir=self.root_dir)
+
+    def status(self, command):
+        """Get the status of the given process in pueue."""
+        if isinstance(self.pueue_status['data'], dict):
+            # Get the status of the latest submitted job, with this command.
+            highest_key = None
+            for key, value in self.pueue_status['data'].items():
+                if value['command'] == command:
+                    if highest_key is None or highest_key < key:
+                        highest_key = key
+            if highest_key is not None:
+                return self.pueue_status['data'][highest_key]['status']
+        return None
+
+    def add(self, command, path, slots=1):
+        """Create a new pueue task. Pueue only knows about its own parallel setting."""
+        from pueue.client.manipulation import execute_add
+        args = {
+            'command': [command],
+            'path': path,
+        }
+
+        Logger.info(f'Add task pueue:\n {command}')
+        with metrics.phase('executor'):
+            execute_add(args, self.root_dir)
+
+    def kill(self, command):
+        """Kill the running and remove the queued pueue tasks with this command."""
+        from pueue.client.factories import command_factory
+        keys = []
+        if isinstance(self.pueue_status['data'], dict):
+            for key, value in self.pueue_status['data'].items():
+                if value['command'] == command and value['status'] in ['queued', 'running', 'stashed', 'paused']:
+                    keys.append(key)
+        if keys:
+            with metrics.phase('executor'):
+                command_factory('kill')({'keys': keys, 'signal': 'sigterm', 'remove': True}, root_dir=self.root_dir)
+
+    def poll(self, tasks):
+        """Check the local hints for finished tasks."""
+        return self.watcher.poll(tasks)
+
+    def wait(self, tasks, timeout):
+        """Wait for local hints for finished tasks."""
+        return self.watcher.wait(tasks, timeout)
+
+
+class LocalExecutor(Executor):
+    """Run commands in a pool of concurrent subprocesses.
+
+    Every job occupies a number of slots, as many jobs run in parallel as fit into `capacity`.
+
+    The state of all jobs is persisted in the database.
+    Subprocesses are started in their own session and survive a restart of encarne.
+    Such jobs are picked up again by their pid and the start time of their process after a restart.
+    Their exit code is unknown, they are only done, if their progress file has been finished.
+    Queued jobs and jobs, which have been lost otherwise, are forgotten and
+    will be scheduled again by the next scan.
+
+    The worker threads never touch the database session.
+    They only report to `refresh`, which runs in the main thread.
+    """
+
+    # The size of the stderr tail, which is saved in the database.
+    STDERR_TAIL = 4096
+
+    def __init__(self, session, capacity):
+        """Resume the jobs of a previous run and start the workers."""
+        self.session = session
+        self.condition = threading.Condition()
+        self.queue = deque()
+        self.started = {}
+        self.finished = {}
+        self.killed = set()
+
+        self.jobs = {}
+        self.orphans = {}
+        for job in session.query(Job).order_by(Job.id).all():
+            if job.status == 'running' and is_same_process(job.pid, job.process_start):
+                Logger.info(f'Resuming running job {job.id} with pid {job.pid}')
+                self.orphans[job.id] = job
+            elif job.status == 'running' and is_progress_finished(job):
+                job.status = 'done'
+                job.finished = time.time()
+            elif job.status in ['queued', 'running']:
+                session.delete(job)
+                continue
+            self.jobs[job.command] = job
+        session.commit()
+
+        # Resumed jobs occupy their slots, until they finished.
+        self.capacity = max(1, capacity)
+        self.active = sum(job.slots for job in self.orphans.values())
+        for _ in range(self.capacity):
+            thread = threading.Thread(target=self.work, daemon=True)
+            thread.start()
+
+    def refresh(self):
+        """Persist all status changes reported by the workers."""
+        with self.condition:
+            started, self.started = self.started, {}
+            finished, self.finished = self.finished, {}
+
+        jobs = {job.id: job for job in self.jobs.values()}
+        for job_id, (pid, process_start, timestamp) in started.items():
+            job = jobs.get(job_id)
+            if job is not None:
+                job.status = 'running'
+                job.pid = pid
+                job.process_start = process_start
+                job.started = timestamp
+
+        for job_id, (returncode, stderr, timestamp, user_time, system_time) in finished.items():
+            job = jobs.get(job_id)
+            if job is not None:
+                job.status = 'done' if returncode == 0 else 'failed'
+                job.returncode = returncode
+                job.stderr = stderr
+                job.finished = timestamp
+                job.user_time = user_time
+                job.system_time = system_time
+
+        # Jobs of a previous run can only be watched by their pid.
+        # Their exit code is unknown, e.g. they might have been killed part-way.
+        # Lost jobs are forgotten, so they are encoded again.
+        for job_id, job in list(self.orphans.items()):
+            if not is_same_process(job.pid, job.process_start):
+                del self.orphans[job_id]
+                if is_progress_finished(job):
+                    job.status = 'done'
+                    job.finished = time.time()
+                else:
+                    Logger.warning(f'Job {job.id} with pid {job.pid} has been lost')
+                    if self.jobs.get(job.command) is job:
+                        del self.jobs[job.command]
+                    self.session.delete(job)
+                with self.condition:
+                    self.active -= job.slots
+                    self.condition.notify_all()
+
+        self.session.commit()
+
+    def status(self, command):
+        """Get the status of the job with this command."""
+        job = self.jobs.get(command)
+        if job is None:
+            return None
+        return job.status
+
+    def add(self, command, path, slots=1):
+        """Persist a new job and queue it for the workers."""
+        job = Job(command, path, slots)
+        self.session.add(job)
+        self.session.commit()
+        self.jobs[command] = job
+
+        Logger.info(f'Add local job:\n {command}')
+        with self.condition:
+            self.queue.append((job.id, command, path, min(slots, self.capacity)))
+            self.condition.notify_all()
+
+    def remove(self, command):
+        """Delete the finished job with this command."""
+        job = self.jobs.get(command)
+        if job is not None and job.status in ['done', 'failed']:
+            del self.jobs[command]
+            self.session.delete(job)
+            self.session.commit()
+
+    def kill(self, command):
+        """Stop the queued or running job with this command.
+
+        A killed job is reported as failed by its worker.
+        """
+        job = self.jobs.get(command)
+        if job is None or job.status in ['done', 'failed']:
+            return
+
+        # Jobs of a previous run are only known by their pid.
+        if job.id in self.orphans:
+            kill_process_group(job.pid)
+            del self.orphans[job.id]
+            job.status = 'failed'
+            job.finished = time.time()
+            self.session.commit()
+            with self.condition:
+                self.active -= job.slots
+                self.condition.notify_all()
+            return
+
+        with self.condition:
+            self.killed.add(job.id)
+            for item in list(self.queue):
+                if item[0] == job.id:
+                    self.queue.remove(item)
+                    self.finished[job.id] = (-signal.SIGTERM, 'Killed before start', time.time(), None, None)
+            pid = self.started.get(job.id, (job.pid, None, None))[0]
+            self.condition.notify_all()
+
+        if pid is not None:
+            kill_process_group(pid)
+
+    def usage(self, command):
+        """Get the resource usage of the job with this command."""
+        job = self.jobs.get(command)
+        if job is None:
+            return None
+        return job.started, job.finished, job.user_time, job.system_time
+
+    def poll(self, tasks):
+        """Check whether any worker reported a change."""
+        with self.condition:
+            return len(self.started) > 0 or len(self.finished) > 0
+
+    def wait(self, tasks, timeout):
+        """Wait until a worker reports a started or finished job.
+
+        Started jobs are persisted right away. Otherwise a restart of encarne wouldn't know their pid,
+        would schedule them again and a second process would write to the same output.
+        """
+        # Jobs of a previous run can't notify us.
+        if len(self.orphans) > 0:
+            timeout = min(timeout, 1)
+
+        with self.condition:
+            changed = self.condition.wait_for(lambda: len(self.started) > 0 or len(self.finished) > 0, timeout)
+            started = len(self.started) > 0
+
+        if started:
+            self.refresh()
+        return changed
+
+    def work(self):
+        """Run queued jobs, one at a time."""
+        def fits():
+            return len(self.queue) > 0 and self.active + self.queue[0][3] <= self.capacity
+
+        while True:
+            with self.condition:
+                self.condition.wait_for(fits)
+                job_id, command, path, slots = self.queue.popleft()
+                self.active += slots
+
+            with tempfile.TemporaryFile() as stderr:
+                try:
+                    process = subprocess.Popen(
+                        command,
+                        shell=True,
+                        cwd=path,
+                        stdin=subprocess.DEVNULL,
+                        stdout=subprocess.DEVNULL,
+                        stderr=stderr,
+                        start_new_session=True,
+                    )
+                except OSError as error:
+                    with self.condition:
+                        self.active -= slots
+                        self.finished[job_id] = (-1, str(error), time.time(), None, None)
+                        self.condition.notify_all()
+                    continue
+
+                metrics.count('subprocesses')
+                with self.condition:
+                    self.started[job_id] = (process.pid, get_process_start(process.pid), time.time())
+                    self.condition.notify_all()
+                    # The job might have been killed, while it was started.
+                    if job_id in self.killed:
+                        kill_process_group(process.pid)
+
+                # Wait for the process ourselves, to get the resource usage of it and its children.
+                _, wait_status, rusage = os.wait4(process.pid, 0)
+                returncode = os.waitstatus_to_exitcode(wait_status)
+                process.returncode = returncode
+
+                stderr.seek(0, os.SEEK_END)
+                stderr.seek(max(0, stderr.tell() - self.STDERR_TAIL))
+                output = stderr.read().decode(errors='replace')
+
+            with self.condition:
+                self.active -= slots
+                self.finished[job_id] = (returncode, output, time.time(), rusage.ru_utime, rusage.ru_stime)
+                self.condition.notify_all()
+
+
+def kill_process_group(pid):
+    """Terminate a job, which has been started in its own session, with all its children."""
+    try:
+        os.killpg(pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def is_alive(pid):
+    """Check whether a process with this pid exists."""
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def get_process_start(pid):
+    """Get the boot id and the start time of a process, which identify it across pid reuse and reboots.
+
+    Return `None`, if the process is gone or `/proc` isn't available.
+    """
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as boot_file:
+            boot_id = boot_file.read().strip()
+        with open(f'/proc/{pid}/stat') as stat_file:
+            stat = stat_file.read()
+    except OSError:
+        return None
+
+    # The name of the process may contain spaces and parentheses, the start time is the 22nd field.
+    fields = stat[stat.rindex(')') + 2:].split()
+    return f'{boot_id}:{fields[19]}'
+
+
+def is_same_process(pid, process_start):
+    """Check whether the process of a job still exists and hasn't been replaced by another one with the same pid."""
+    if not is_alive(pid):
+        return False
+    current = get_process_start(pid)
+    # Without `/proc` the pid is all we know.
+    if current is None or process_start is None:
+        return True
+    return current == process_start
+
+
+def is_progress_finished(job):
+    """Check whether the progress file of a job's ffmpeg command has been finished."""
+    arguments = shlex.split(job.command)
+    if '-progress' not in arguments[:-1]:
+        return False
+    path = os.path.join(job.path, arguments[arguments.index('-progress') + 1])
+    return is_finished(read_progress(path))
@@ -0,0 +1,49 @@
+"""Hashing of encoded movies in the background."""
+from concurrent.futures import ThreadPoolExecutor
+
+from encarne.logger import Logger
+from encarne.media import get_sha1
+
+
+class BackgroundHasher():
+    """Compute the sha1 of encoded movies, while encarne keeps handling other encodes.
+
+    ffmpeg rewrites the header of a Matroska file, once an encode is finished.
+    The hash of the final file therefore can't be computed, while it's being written.
+    Instead, an encoded movie is put into place right away and hashed afterwards,
+    while it's most likely still in the page cache.
+
+    The hashes are computed in a worker thread, but are stored by the main thread.
+    """
+
+    def __init__(self, session, workers=1):
+        """Create a new hasher."""
+        self.session = session
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.pending = []
+
+    def add(self, movie, path):
+        """Hash the file of a movie."""
+        self.pending.append((movie, path, self.pool.submit(get_sha1, path)))
+
+    def collect(self, wait=False):
+        """Store the hashes of all hashed files.
+
+        With `wait`, block until all files are hashed.
+        """
+        remaining = []
+        collected = False
+        for movie, path, future in self.pending:
+            if not wait and not future.done():
+                remaining.append((movie, path, future))
+                continue
+
+            try:
+                movie.sha1 = future.result()
+                collected = True
+            except OSError as error:
+                Logger.warning(f'Failed to hash {path}: {error}')
+
+        self.pending = remaining
+        if collected:
+            self.session.commit()
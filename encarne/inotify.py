@@ -0,0 +1,84 @@
+"""Minimal inotify bindings by ctypes."""
+import os
+import errno
+import ctypes
+import select
+import struct
+import ctypes.util
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_CLOEXEC = os.O_CLOEXEC
+IN_NONBLOCK = os.O_NONBLOCK
+
+# struct inotify_event: wd, mask, cookie and the length of the name, which follows.
+EVENT = struct.Struct('iIII')
+
+
+class Inotify():
+    """An inotify instance, whose events are read without blocking."""
+
+    def __init__(self):
+        """Create a new inotify instance."""
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            self.raise_error()
+
+    def raise_error(self, path=None):
+        """Raise the error of the last libc call."""
+        code = ctypes.get_errno()
+        raise OSError(code, os.strerror(code), path)
+
+    def add_watch(self, path, mask):
+        """Watch a path and get the watch descriptor. Watching a path twice returns the same descriptor."""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            self.raise_error(path)
+        return wd
+
+    def read(self, timeout):
+        """Wait for events up to `timeout` seconds.
+
+        Return a list of `(wd, mask, name)` tuples. `name` is empty for events of the watched path itself.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            except OSError as error:
+                if error.errno == errno.EINTR:
+                    continue
+                raise
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                events.append((wd, mask, name))
+
+        return events
+
+    def close(self):
+        """Close the instance and remove all its watches."""
+        os.close(self.fd)
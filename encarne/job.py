@@ -0,0 +1,33 @@
+"""The sqlite model for a job of the local executor."""
+from sqlalchemy import Column, String, Float, Integer, Text
+
+from encarne.db import base
+
+
+class Job(base):
+    """The sqlite model for a job of the local executor."""
+
+    __tablename__ = 'job'
+
+    id = Column(Integer(), primary_key=True)
+    command = Column(Text(), nullable=False, index=True)
+    path = Column(String(480), nullable=False)
+    status = Column(String(20), nullable=False, default='queued')
+    slots = Column(Integer(), nullable=False, default=1)
+    pid = Column(Integer())
+    # The boot id and start time of the process, which tell a reused pid apart.
+    process_start = Column(String(60))
+    returncode = Column(Integer())
+    stderr = Column(Text())
+    started = Column(Float())
+    finished = Column(Float())
+    # The cpu time of the process and its children in seconds.
+    user_time = Column(Float())
+    system_time = Column(Float())
+
+    def __init__(self, command, path, slots=1):
+        """Create a new queued job."""
+        self.command = command
+        self.path = path
+        self.slots = slots
+        self.status = 'queued'
@@ -15,24 +15,31 @@ class DirRotatingFileHandler(RotatingFileHandler):
         RotatingFileHandler.__init__(self, filename, **kwargs)
 
 
-# Logger init and logger format
+# Logger init. Handlers are only added by `setup_logging`,
+# so importing encarne doesn't touch the file system.
 Logger = logging.getLogger('')
-Logger.setLevel(logging.INFO)
-format_str = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
 
-# Stream handler
-channel_handler = logging.StreamHandler(sys.stdout)
-channel_handler.setFormatter(format_str)
-Logger.addHandler(channel_handler)
 
-# Log file and log dir
-home = os.path.expanduser('~')
-timestamp = time.strftime('-%Y%m%d-%H%M-')
-log_dir = os.path.join(home, '.local/share/encarne')
-log_file = os.path.join(log_dir, f'encarne{timestamp}.log')
+def setup_logging():
+    """Log to stdout and to a timestamped log file.
 
+    The log file is only created, once the first message is logged.
+    """
+    Logger.setLevel(logging.INFO)
+    format_str = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
 
-# File handler
-file_handler = DirRotatingFileHandler(log_file, maxBytes=(1048576*100), backupCount=7)
-file_handler.setFormatter(format_str)
-Logger.addHandler(file_handler)
+    # Stream handler
+    channel_handler = logging.StreamHandler(sys.stdout)
+    channel_handler.setFormatter(format_str)
+    Logger.addHandler(channel_handler)
+
+    # Log file and log dir
+    home = os.path.expanduser('~')
+    timestamp = time.strftime('-%Y%m%d-%H%M-')
+    log_dir = os.path.join(home, '.local/share/encarne')
+    log_file = os.path.join(log_dir, f'encarne{timestamp}.log')
+
+    # File handler
+    file_handler = DirRotatingFileHandler(log_file, maxBytes=(1048576*100), backupCount=7, delay=True)
+    file_handler.setFormatter(format_str)
+    Logger.addHandler(file_handler)
@@ -1,21 +1,26 @@
 """Mediainfo related code."""
 import os
 import math
+import time
 import hashlib
 import subprocess
 
-from lxml import etree
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 from encarne.logger import Logger
+from encarne.metrics import metrics
 
 
-def check_duration(origin, temp, seconds=1):
-    """Check if the duration is bigger than a specific amount."""
+def check_duration(origin, temp, seconds=1, origin_duration=None):
+    """Check if the duration is bigger than a specific amount.
+
+    A known `origin_duration` avoids probing the original file again.
+    """
     # If the destination movie is shorter than a maximum of 1 seconds as the
     # original or has no duration property in mediainfo, the task will be dropped.
-    origin_duration = get_media_duration(origin)
-    duration = get_media_duration(temp)
+    if origin_duration is None:
+        origin_duration = probe_media(origin).duration
+    duration = probe_media(temp).duration
 
     # If we can't get the duration the user needs to check manually.
     if origin_duration is None:
@@ -47,67 +52,102 @@ def check_file_size(origin, temp):
         return True, False
 
 
-def get_media_encoding(path):
-    """Execute external mediainfo command and find the video encoding library."""
-    # Get mediainfo output
-    process = subprocess.run(
-        ['mediainfo', '--Output=XML', path],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
-    root = etree.XML(process.stdout)
+MEDIAINFO_NAMESPACE = {'ns': 'https://mediaarea.net/mediainfo'}
 
-    # Try writing library
-    try:
-        writing_library = root.findall('.//{https://mediaarea.net/mediainfo}track[@type="Video"]/{https://mediaarea.net/mediainfo}Writing_library')[0].text
-    except BaseException:
-        writing_library = 'unknown'
 
-    # Try encoded library name
-    if writing_library == 'unknown':
-        try:
-            writing_library = root.findall('.//{https://mediaarea.net/mediainfo}track[@type="Video"]/{https://mediaarea.net/mediainfo}Encoded_Library_Name')[0].text
-        except BaseException:
-            writing_library = 'unknown'
+class MediaProbe():
+    """Attributes of a video container, gathered by a single mediainfo run."""
+
+    def __init__(self, codec=None, writing_library='unknown', duration=None,
+                 bitrate=None, width=None, height=None, streams=None):
+        """Create a new probe result."""
+        self.codec = codec
+        self.writing_library = writing_library
+        self.duration = duration
+        self.bitrate = bitrate
+        self.width = width
+        self.height = height
+        self.streams = streams or []
 
-    return writing_library
 
+def probe_media(path):
+    """Execute external mediainfo command and parse all needed attributes."""
+    # lxml is only needed for scans, don't slow down the startup of other commands.
+    from lxml import etree
 
-def get_media_duration(path):
-    """Execute external mediainfo command and find the video encoding library."""
+    start = time.perf_counter()
     process = subprocess.run(
-        ['mediainfo', '--Output=PBCore2', path],
+        ['mediainfo', '--Output=XML', path],
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
     )
-    root = etree.XML(process.stdout)
+    seconds = time.perf_counter() - start
+    metrics.count('subprocesses')
+    metrics.add_phase('probe', seconds)
+    metrics.observe('probe_seconds', seconds)
     try:
-        duration = root.find(
-            ".//ns:instantiationDuration",
-            namespaces={'ns': 'http://www.pbcore.org/PBCore/PBCoreNamespace.html'},
-        ).text
-    except IndexError:
-        Logger.info(f'Could not find duration for {path}')
-        return None
+        root = etree.XML(process.stdout)
+    except etree.XMLSyntaxError:
+        Logger.info(f'Could not parse mediainfo output for {path}')
+        return MediaProbe()
+
+    general = root.find('.//ns:track[@type="General"]', namespaces=MEDIAINFO_NAMESPACE)
+    video = root.find('.//ns:track[@type="Video"]', namespaces=MEDIAINFO_NAMESPACE)
+
+    # Try writing library and encoded library name
+    writing_library = get_track_value(video, 'Writing_library') \
+        or get_track_value(video, 'Encoded_Library_Name') \
+        or 'unknown'
 
+    duration = get_track_value(general, 'Duration') or get_track_value(video, 'Duration')
     try:
-        duration = duration.split('.')[0].split(';')[0]
-        date = datetime.strptime(duration, '%H:%M:%S')
-    except BaseException:
-        try:
-            duration = duration.rsplit(':', 1)[0]
-            date = datetime.strptime(duration, '%H:%M:%S')
-        except BaseException:
-            Logger.info(f'Unknown duration: {duration}')
-            return None
-
-    delta = timedelta(
-        hours=date.hour,
-        minutes=date.minute,
-        seconds=date.second,
+        duration = timedelta(seconds=float(duration))
+    except (TypeError, ValueError):
+        Logger.info(f'Unknown duration for {path}: {duration}')
+        duration = None
+
+    streams = []
+    for track in root.findall('.//ns:track', namespaces=MEDIAINFO_NAMESPACE):
+        if track.get('type') == 'General':
+            continue
+        streams.append({
+            'type': track.get('type'),
+            'format': get_track_value(track, 'Format'),
+        })
+
+    return MediaProbe(
+        codec=get_track_value(video, 'Format'),
+        writing_library=writing_library,
+        duration=duration,
+        bitrate=get_track_number(general, 'OverallBitRate'),
+        width=get_track_number(video, 'Width'),
+        height=get_track_number(video, 'Height'),
+        streams=streams,
     )
 
-    return delta
+
+def probe_file(path):
+    """Probe and fingerprint a file."""
+    return probe_media(path), get_fingerprint(path)
+
+
+def get_track_value(track, name):
+    """Get the text of a mediainfo track attribute."""
+    if track is None:
+        return None
+    element = track.find(f'ns:{name}', namespaces=MEDIAINFO_NAMESPACE)
+    if element is None:
+        return None
+    return element.text
+
+
+def get_track_number(track, name):
+    """Get a numeric mediainfo track attribute."""
+    value = get_track_value(track, name)
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
 
 
 def get_sha1(path):
@@ -116,11 +156,34 @@ def get_sha1(path):
     BUF_SIZE = 16 * 65536  # lets read stuff in 64kb chunks!
 
     sha1 = hashlib.sha1()
-    with open(path, 'rb') as f:
+    with metrics.phase('hash'), open(path, 'rb') as f:
         while True:
             data = f.read(BUF_SIZE)
             if not data:
                 break
             sha1.update(data)
+            metrics.count('bytes_hashed', len(data))
+
+    return sha1.hexdigest()
+
+
+def get_fingerprint(path):
+    """Return a fast fingerprint of a file.
+
+    The fingerprint is the sha1 of the file size and three chunks from the
+    head, the middle and the tail of the file.
+    Only a few hundred KB are read, no matter how big the file is.
+    """
+    CHUNK_SIZE = 128 * 1024
+
+    size = os.path.getsize(path)
+    sha1 = hashlib.sha1(str(size).encode())
+    with metrics.phase('fingerprint'), open(path, 'rb') as f:
+        if size <= 3 * CHUNK_SIZE:
+            sha1.update(f.read())
+        else:
+            for offset in [0, (size - CHUNK_SIZE) // 2, size - CHUNK_SIZE]:
+                f.seek(offset)
+                sha1.update(f.read(CHUNK_SIZE))
 
     return sha1.hexdigest()
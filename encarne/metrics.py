@@ -0,0 +1,118 @@
+"""Timing of the phases and metrics of a run."""
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from encarne.logger import Logger
+
+
+class Metrics():
+    """Phase timers, counters and histograms of a single run.
+
+    Phases may run in several threads at once, e.g. probing.
+    Their times are summed up and may exceed the wall time of the run.
+    """
+
+    # The upper bounds of the histogram buckets.
+    BUCKETS = {
+        'queue_depth': [0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024],
+        'probe_seconds': [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+        'db_statement_seconds': [0.0001, 0.001, 0.01, 0.1, 1],
+    }
+
+    def __init__(self):
+        """Create empty metrics."""
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.phases = {}
+        self.counters = {}
+        self.histograms = {}
+
+    @contextmanager
+    def phase(self, name):
+        """Time a phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def add_phase(self, name, seconds):
+        """Add the time of a finished phase."""
+        with self.lock:
+            total, calls = self.phases.get(name, (0, 0))
+            self.phases[name] = (total + seconds, calls + 1)
+
+    def count(self, name, value=1):
+        """Increase a counter."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """Add a value to a histogram."""
+        with self.lock:
+            buckets, total, count = self.histograms.get(name, ([0] * len(self.BUCKETS[name]), 0, 0))
+            for index, bound in enumerate(self.BUCKETS[name]):
+                if value <= bound:
+                    buckets[index] += 1
+            self.histograms[name] = (buckets, total + value, count + 1)
+
+    def report(self):
+        """Log the phase breakdown, all counters and histograms."""
+        Logger.info(f'Profile of the run, which took {time.time() - self.started:.2f}s:')
+        for name, (seconds, calls) in sorted(self.phases.items(), key=lambda item: -item[1][0]):
+            Logger.info(f'  {name}: {seconds:.3f}s in {calls} calls')
+        for name, value in sorted(self.counters.items()):
+            Logger.info(f'  {name}: {value}')
+        for name, (_, total, count) in sorted(self.histograms.items()):
+            Logger.info(f'  {name}: {count} observations, mean {total / count:.4g}')
+
+    def write_textfile(self, path):
+        """Write all metrics in the Prometheus text format, e.g. for node_exporter's textfile collector.
+
+        The file is replaced atomically, so a scrape never sees a partial file.
+        """
+        lines = [
+            '# HELP encarne_last_run_timestamp_seconds The time, at which the last run finished.',
+            '# TYPE encarne_last_run_timestamp_seconds gauge',
+            f'encarne_last_run_timestamp_seconds {time.time():.3f}',
+            '# HELP encarne_run_seconds The wall time of the last run.',
+            '# TYPE encarne_run_seconds gauge',
+            f'encarne_run_seconds {time.time() - self.started:.6f}',
+            '# HELP encarne_phase_seconds The time spent in each phase of the last run.',
+            '# TYPE encarne_phase_seconds gauge',
+        ]
+        with self.lock:
+            for name, (seconds, _) in sorted(self.phases.items()):
+                lines.append(f'encarne_phase_seconds{{phase="{name}"}} {seconds:.6f}')
+            lines += [
+                '# HELP encarne_phase_calls The number of times each phase ran in the last run.',
+                '# TYPE encarne_phase_calls gauge',
+            ]
+            for name, (_, calls) in sorted(self.phases.items()):
+                lines.append(f'encarne_phase_calls{{phase="{name}"}} {calls}')
+
+            for name, value in sorted(self.counters.items()):
+                lines += [
+                    f'# TYPE encarne_{name} gauge',
+                    f'encarne_{name} {value}',
+                ]
+
+            for name, (buckets, total, count) in sorted(self.histograms.items()):
+                lines.append(f'# TYPE encarne_{name} histogram')
+                for bound, bucket in zip(self.BUCKETS[name], buckets):
+                    lines.append(f'encarne_{name}_bucket{{le="{bound}"}} {bucket}')
+                lines += [
+                    f'encarne_{name}_bucket{{le="+Inf"}} {count}',
+                    f'encarne_{name}_sum {total}',
+                    f'encarne_{name}_count {count}',
+                ]
+
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as textfile:
+            textfile.write('\n'.join(lines) + '\n')
+        os.replace(temp_path, path)
+
+
+metrics = Metrics()
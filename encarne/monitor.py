@@ -0,0 +1,144 @@
+"""Watch a library for new movies."""
+import os
+import time
+
+from encarne.inotify import (
+    Inotify,
+    IN_ATTRIB,
+    IN_CLOSE_WRITE,
+    IN_CREATE,
+    IN_IGNORED,
+    IN_ISDIR,
+    IN_MODIFY,
+    IN_MOVED_TO,
+    IN_ONLYDIR,
+    IN_Q_OVERFLOW,
+)
+from encarne.logger import Logger
+
+
+class LibraryMonitor():
+    """Notice new and changed files of a library by inotify.
+
+    Every directory of the library is watched on its own.
+    Files are only reported, once their size and mtime didn't change for `settle_time` seconds,
+    so files, which are still being downloaded or copied, aren't encoded too early.
+
+    Events can get lost, e.g. if the kernel's event queue overflows or the watch limit is reached.
+    `overflowed` is set in these cases and the library should be scanned again.
+    """
+
+    MASK = IN_CREATE | IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_ONLYDIR
+    FILE_EVENTS = IN_CREATE | IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO
+
+    def __init__(self, directory, walker, settle_time):
+        """Watch all directories of a library.
+
+        `walker` decides, which files and directories belong to the library.
+        """
+        self.walker = walker
+        self.settle_time = settle_time
+        self.inotify = Inotify()
+        # Watched directories by their watch descriptor.
+        self.directories = {}
+        # Unsettled files with their last size, mtime and the time they were last seen changing.
+        self.pending = {}
+        self.overflowed = False
+
+        self.watch_tree(directory)
+
+    def watch_tree(self, directory, new=False):
+        """Watch a directory and all of its subdirectories.
+
+        The files of a `new` directory, e.g. one that has been moved into the library, are added as pending,
+        as they don't cause any events of their own.
+        """
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            try:
+                wd = self.inotify.add_watch(current, self.MASK)
+                entries = list(os.scandir(current))
+            except OSError as error:
+                Logger.warning(f'Failed to watch {current}: {error}')
+                self.overflowed = True
+                continue
+            self.directories[wd] = current
+
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not self.walker.is_skipped(entry.name) and \
+                                not self.walker.is_excluded(entry.name, entry.path):
+                            stack.append(entry.path)
+                    elif new and self.is_movie(entry.name, entry.path):
+                        self.add(entry.path)
+                except OSError:
+                    continue
+
+    def is_movie(self, name, path):
+        """Check whether a file is a video container, which isn't excluded."""
+        return name.lower().endswith(self.walker.extensions) and not self.walker.is_excluded(name, path)
+
+    def add(self, path):
+        """Wait for a file to settle."""
+        self.pending[path] = (None, None, time.time())
+
+    def defer_unsettled(self, paths):
+        """Pass on all paths of files, which didn't change for `settle_time` seconds, and wait for the others."""
+        for path in paths:
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+
+            if time.time() - mtime < self.settle_time:
+                self.add(path)
+            else:
+                yield path
+
+    def wait(self, timeout):
+        """Wait up to `timeout` seconds for events and handle them."""
+        for wd, mask, name in self.inotify.read(timeout):
+            if mask & IN_Q_OVERFLOW:
+                Logger.warning('Lost inotify events, the library will be scanned again')
+                self.overflowed = True
+                continue
+
+            directory = self.directories.get(wd)
+            if directory is None:
+                continue
+
+            # The watch is gone, if the directory has been removed.
+            # A directory, which has been moved within the library, keeps its watch descriptor
+            # and its path is updated by the event of its new parent.
+            if mask & IN_IGNORED:
+                del self.directories[wd]
+                continue
+
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not self.walker.is_skipped(name) \
+                        and not self.walker.is_excluded(name, path):
+                    self.watch_tree(path, new=True)
+            elif mask & self.FILE_EVENTS and self.is_movie(name, path):
+                self.add(path)
+
+    def get_settled(self):
+        """Get all pending files, whose size and mtime didn't change for `settle_time` seconds."""
+        settled = []
+        now = time.time()
+        for path, (size, mtime_ns, since) in list(self.pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                self.pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+            elif now - since >= self.settle_time:
+                del self.pending[path]
+                settled.append(path)
+
+        return settled
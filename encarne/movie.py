@@ -1,10 +1,11 @@
 """The sqlite model for a Movie."""
 import os
-from sqlalchemy import Column, String, Boolean, Integer
+from collections import defaultdict
+from sqlalchemy import Column, String, Boolean, Integer, Float
 
 from encarne.db import base
 from encarne.logger import Logger
-from encarne.media import get_sha1
+from encarne.media import get_fingerprint, get_sha1
 
 
 class Movie(base):
@@ -12,97 +13,199 @@ class Movie(base):
 
     __tablename__ = 'movie'
 
-    sha1 = Column(String(40))
+    sha1 = Column(String(40), index=True)
+    fingerprint = Column(String(40), index=True)
     name = Column(String(240), primary_key=True)
-    directory = Column(String(240), primary_key=True)
+    directory = Column(String(240), primary_key=True, index=True)
     size = Column(Integer())
     original_size = Column(Integer())
     encoded = Column(Boolean(), nullable=False, default=False)
     failed = Column(Boolean(), nullable=False, default=False)
+    # The size of the encoded movie relative to the original, as predicted by samples.
+    predicted_ratio = Column(Float())
 
-    def __init__(self, sha1, name, directory, size, encoded=False, failed=False):
+    def __init__(self, sha1, name, directory, size, fingerprint=None, encoded=False, failed=False):
         """Create a new Movie."""
         self.sha1 = sha1
+        self.fingerprint = fingerprint
         self.name = name
         self.directory = directory
         self.size = size
         self.original_size = size
 
     @staticmethod
-    def get_or_create(session, name, directory, size, **kwargs):
-        """Get or create a new Movie."""
-        movie = session.query(Movie) \
-            .filter(Movie.name == name) \
-            .filter(Movie.directory == directory) \
-            .filter(Movie.size == size) \
-            .one_or_none()
+    def hash_movies(session):
+        """Compute the sha1 of all existing movies, which haven't been hashed yet."""
+        movies = session.query(Movie) \
+            .filter(Movie.sha1.is_(None)) \
+            .all()
+        for movie in movies:
+            path = os.path.join(movie.directory, movie.name)
+            if not os.path.exists(path):
+                continue
 
+            Logger.info(f'Hashing {path}')
+            movie.sha1 = get_sha1(path)
+            session.commit()
+
+    @staticmethod
+    def clean_movies(session, chunk_size=500):
+        """Remove all deleted movies.
+
+        Each directory is listed once and its missing movies are deleted in chunks.
+        If a directory doesn't exist anymore, all of its movies are deleted at once.
+        """
+        directories = [directory for (directory,) in session.query(Movie.directory).distinct()]
+        removed = 0
+        for index, directory in enumerate(directories, start=1):
+            try:
+                with os.scandir(directory) as entries:
+                    existing = {entry.name for entry in entries}
+            except (FileNotFoundError, NotADirectoryError):
+                Logger.info(f'Remove directory {directory}')
+                removed += session.query(Movie) \
+                    .filter(Movie.directory == directory) \
+                    .delete(synchronize_session=False)
+                session.commit()
+                existing = None
+            except OSError as error:
+                # Don't delete anything, if a directory can't be listed right now.
+                Logger.warning(f'Failed to list {directory}: {error}')
+                existing = None
+
+            if existing is not None:
+                names = [name for (name,) in session.query(Movie.name).filter(Movie.directory == directory)]
+                missing = [name for name in names if name not in existing]
+                for name in missing:
+                    Logger.debug(f'Remove {os.path.join(directory, name)}')
+                for start in range(0, len(missing), chunk_size):
+                    removed += session.query(Movie) \
+                        .filter(Movie.directory == directory) \
+                        .filter(Movie.name.in_(missing[start:start + chunk_size])) \
+                        .delete(synchronize_session=False)
+                if missing:
+                    session.commit()
+
+            if index % 100 == 0 or index == len(directories):
+                Logger.info(f'Checked {index}/{len(directories)} directories, removed {removed} movies')
+
+
+class MovieIndex():
+    """In-memory index of all movies.
+
+    The movie table is loaded once and reconciled in memory.
+    Changes are committed in batches of `batch_size` changed movies.
+    """
+
+    def __init__(self, session, batch_size=1000):
+        """Load all movies."""
+        self.session = session
+        self.batch_size = batch_size
+        self.changes = 0
+
+        self.by_path = {}
+        self.by_fingerprint = defaultdict(list)
+        for movie in session.query(Movie).all():
+            self.add(movie)
+
+    def add(self, movie):
+        """Add a movie to the index."""
+        self.by_path[(movie.directory, movie.name)] = movie
+        if movie.fingerprint is not None:
+            self.by_fingerprint[movie.fingerprint].append(movie)
+
+    def remove(self, movie):
+        """Remove a movie from the index."""
+        del self.by_path[(movie.directory, movie.name)]
+        if movie in self.by_fingerprint.get(movie.fingerprint, []):
+            self.by_fingerprint[movie.fingerprint].remove(movie)
+
+    def get_or_create(self, name, directory, size, sha1=None, fingerprint=None):
+        """Get or create a new Movie.
+
+        Moved or renamed movies are detected by their fingerprint.
+        The full sha1 is only computed to pick between multiple movies with the same fingerprint.
+        A known `sha1` or `fingerprint` of the file is used instead of reading it again.
+        """
+        path = os.path.join(directory, name)
+        movie = self.by_path.get((directory, name))
+
+        if movie and movie.size == size:
+            if movie.fingerprint is None:
+                movie.fingerprint = fingerprint or get_fingerprint(path)
+                self.add(movie)
+                self.changed()
+            if movie.sha1 is None and sha1 is not None:
+                movie.sha1 = sha1
+                self.changed()
+            return movie
+
+        # Delete any other movie with differing size.
+        # This might be necessary in case we get a new release, with a different size.
+        # The row is deleted right away, so a moved movie or a new movie can take its path.
         if movie:
+            self.remove(movie)
+            self.session.delete(movie)
+            self.session.flush()
+            self.changed()
+
+        # Found a movie with the same fingerprint.
+        # It probably moved from one directory into another
+        if fingerprint is None:
+            fingerprint = get_fingerprint(path)
+        movies = list(self.by_fingerprint.get(fingerprint, []))
+
+        # Found multiple movies with the same fingerprint.
+        # Confirm with the full hash, if possible.
+        if len(movies) > 1:
+            if sha1 is None:
+                sha1 = get_sha1(path)
+            confirmed = [movie for movie in movies if movie.sha1 == sha1]
+            if len(confirmed) > 0:
+                movies = confirmed
+
+        if len(movies) > 0:
+            if len(movies) > 1:
+                for movie in movies:
+                    duplicate = os.path.join(movie.directory, movie.name)
+                    Logger.info(f'Found duplicate movies: {duplicate}')
+
+                duplicate = os.path.join(movies[0].directory, movies[0].name)
+                Logger.info(f'Using movie: {duplicate}')
+
+            # Always use the first result
+            movie = movies[0]
+
+            # Inform user about rename or directory change
+            old_path = os.path.join(movie.directory, movie.name)
+            Logger.info(f'{name} moved in some kind of way.')
+            Logger.info(f'Moving from {old_path} to new path {path}.')
+
+            # Set attributes to new location
+            self.remove(movie)
+            movie.name = name
+            movie.directory = directory
+            movie.size = size
             if movie.sha1 is None:
-                movie.sha1 = get_sha1(os.path.join(directory, name))
-
-        if not movie:
-            # Delete any other movies with differing size.
-            # This might be necessary in case we get a new release, with a different size.
-            session.query(Movie) \
-                .filter(Movie.name == name) \
-                .filter(Movie.directory == directory) \
-                .delete()
-
-            # Found a movie with the same sha1.
-            # It probably moved from one directory into another
-            sha1 = get_sha1(os.path.join(directory, name))
-            movies = session.query(Movie) \
-                .filter(Movie.sha1 == sha1) \
-                .all()
-
-            if len(movies) > 0:
-                # Found multiple movies with the same hash. Use the first one.
-                if len(movies) > 1:
-                    for movie in movies:
-                        path = os.path.join(movie.directory, movie.name)
-                        Logger.info(f'Found duplicate movies: {path}')
-
-                    path = os.path.join(movies[0].directory, movies[0].name)
-                    Logger.info(f'Using movie: {path}')
-
-                # Always use the first result
-                movie = movies[0]
-
-                # Inform user about rename or directory change
-                old_path = os.path.join(movie.directory, movie.name)
-                new_path = os.path.join(directory, name)
-                Logger.info(f'{name} moved in some kind of way.')
-                Logger.info(f'Moving from {old_path} to new path {new_path}.')
-
-                # Set attributes to new location
-                movie.name = name
-                movie.directory = directory
-                movie.size = size
+                movie.sha1 = sha1
 
         # Create new movie
-        if not movie:
-            movie = Movie(sha1, name, directory, size, **kwargs)
+        else:
+            movie = Movie(sha1, name, directory, size, fingerprint=fingerprint)
+            self.session.add(movie)
 
-        session.add(movie)
-        session.commit()
-        movie = session.query(Movie) \
-            .filter(Movie.name == name) \
-            .filter(Movie.directory == directory) \
-            .filter(Movie.size == size) \
-            .one()
+        self.add(movie)
+        self.changed()
 
         return movie
 
-    @staticmethod
-    def clean_movies(session):
-        """Remove all deleted movies."""
-        movies = session.query(Movie).all()
-        for movie in movies:
-            # Can't find the file. Remove the movie.
-            path = os.path.join(movie.directory, movie.name)
-            if not os.path.exists(path):
-                Logger.info(f'Remove {path}')
-                session.delete(movie)
+    def changed(self):
+        """Register a change and commit, once a batch is full."""
+        self.changes += 1
+        if self.changes >= self.batch_size:
+            self.commit()
 
-        session.commit()
+    def commit(self):
+        """Commit all pending changes."""
+        self.session.commit()
+        self.changes = 0
@@ -0,0 +1,20 @@
+"""Helpers for the streaming scan pipeline."""
+from collections import deque
+
+
+def bounded_map(pool, function, iterable, buffer):
+    """Map a function over an iterable with a pool of workers.
+
+    Yield `(item, result)` tuples in the order of the iterable.
+    At most `buffer` items are in flight, the iterable is consumed lazily.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append((item, pool.submit(function, item)))
+        if len(pending) >= buffer:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+    while pending:
+        item, future = pending.popleft()
+        yield item, future.result()
@@ -0,0 +1,184 @@
+"""Plan how many encodes run in parallel and how many threads each of them gets."""
+import os
+import math
+
+from encarne.logger import Logger
+
+
+class Layout():
+    """The thread layout of a single encode."""
+
+    def __init__(self, threads, frame_threads, jobs):
+        """Create a new layout."""
+        self.threads = threads
+        self.frame_threads = frame_threads
+        self.jobs = jobs
+
+    def __str__(self):
+        """Describe the layout."""
+        return f'{self.jobs} parallel encodes with {self.threads} threads and {self.frame_threads} frame threads each'
+
+
+class Planner():
+    """Plan the thread layout of encodes by their resolution.
+
+    x265 only scales up to a limited number of threads, which depends on the
+    number of CTU rows of a frame. Encodes of small videos therefore get less threads,
+    so more of them can run in parallel without oversubscribing the cpus.
+    """
+
+    # Video heights above which x265 can keep the given number of threads busy.
+    THREADS_BY_HEIGHT = [
+        (1440, 16),
+        (1080, 12),
+        (720, 8),
+        (0, 4),
+    ]
+
+    def __init__(self):
+        """Detect the available cpus."""
+        self.cpus = get_cpu_count()
+        self.reported = set()
+
+    def plan(self, width, height):
+        """Get the layout for a video of the given resolution."""
+        threads = self.THREADS_BY_HEIGHT[-1][1]
+        if height is not None:
+            for minimum, count in self.THREADS_BY_HEIGHT:
+                if height > minimum:
+                    threads = count
+                    break
+
+        threads = min(threads, self.cpus)
+        jobs = max(1, self.cpus // threads)
+        # Give leftover cpus to the encodes.
+        threads = self.cpus // jobs
+
+        # Frame threads, similar to x265's own choice by pool size.
+        if threads >= 16:
+            frame_threads = 4
+        elif threads >= 8:
+            frame_threads = 3
+        elif threads >= 4:
+            frame_threads = 2
+        else:
+            frame_threads = 1
+
+        layout = Layout(threads, frame_threads, jobs)
+        if (width, height) not in self.reported:
+            self.reported.add((width, height))
+            Logger.info(f'Layout for {width}x{height}: {layout}')
+
+        return layout
+
+    def report(self):
+        """Log the detected cpus."""
+        Logger.info(f'Planning encodes for {self.cpus} available cpus')
+
+
+def get_cpu_count():
+    """Get the number of cpus, which may be used by this process.
+
+    Both, the cpu affinity and the cgroup cpu quota are respected.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = get_cgroup_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.floor(quota)))
+
+    return cpus
+
+
+def get_cgroup_quota(proc_dir='/proc/self'):
+    """Get the cgroup cpu quota in cpus or `None`, if there is no quota.
+
+    The quotas of the process's own cgroup and of all its parents apply, e.g. a systemd `CPUQuota=`
+    of the service or of its slice. The smallest one wins.
+    """
+    quotas = []
+    for directory in get_cgroup_directories(proc_dir):
+        quota = read_cpu_quota(directory)
+        if quota is not None:
+            quotas.append(quota)
+
+    if not quotas:
+        return None
+    return min(quotas)
+
+
+def get_cgroup_directories(proc_dir):
+    """Get the directories of the process's cpu cgroups and of all their parents.
+
+    The cgroups are read from `/proc/self/cgroup`, which holds the cgroup v2 path and the path of the
+    cgroup v1 cpu controller. Their mount points are read from `/proc/self/mountinfo`.
+    """
+    paths = {}
+    try:
+        with open(os.path.join(proc_dir, 'cgroup')) as f:
+            for line in f:
+                hierarchy, controllers, path = line.rstrip('\n').split(':', 2)
+                if hierarchy == '0' and controllers == '':
+                    paths['cgroup2'] = path
+                elif 'cpu' in controllers.split(','):
+                    paths['cgroup'] = path
+
+        with open(os.path.join(proc_dir, 'mountinfo')) as f:
+            mounts = f.readlines()
+    except (OSError, ValueError):
+        return []
+
+    directories = []
+    for line in mounts:
+        # The optional fields are terminated by a single `-`, followed by the type and the super options.
+        fields = line.split()
+        try:
+            separator = fields.index('-')
+            root, mount_point = fields[3], os.path.normpath(fields[4])
+            filesystem, options = fields[separator + 1], fields[separator + 3].split(',')
+        except (ValueError, IndexError):
+            continue
+        if filesystem not in paths or filesystem == 'cgroup' and 'cpu' not in options:
+            continue
+
+        # The mount may only show a subtree of the hierarchy, e.g. in a container.
+        relative = os.path.relpath(paths[filesystem], root)
+        if relative.startswith('..'):
+            continue
+
+        directory = os.path.normpath(os.path.join(mount_point, relative))
+        while True:
+            directories.append(directory)
+            if directory == mount_point:
+                break
+            directory = os.path.dirname(directory)
+
+    return directories
+
+
+def read_cpu_quota(directory):
+    """Read the cpu quota of a single cgroup in cpus or `None`, if it has no quota."""
+    # cgroup v2
+    try:
+        with open(os.path.join(directory, 'cpu.max')) as f:
+            quota, period = f.read().split()
+        if quota == 'max':
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+
+    # cgroup v1
+    try:
+        with open(os.path.join(directory, 'cpu.cfs_quota_us')) as f:
+            quota = int(f.read())
+        with open(os.path.join(directory, 'cpu.cfs_period_us')) as f:
+            period = int(f.read())
+        if quota <= 0:
+            return None
+        return quota / period
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,88 @@
+"""Parsing of ffmpeg's `-progress` output."""
+import os
+
+
+def read_progress(path):
+    """Read the latest progress block of an ffmpeg progress file.
+
+    Return a dict with all `key=value` pairs of the last block or `None`,
+    if there is no progress yet.
+    """
+    # The last block is at most a few hundred bytes.
+    TAIL_SIZE = 4096
+
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - TAIL_SIZE))
+            lines = f.read().decode(errors='replace').splitlines()
+    except OSError:
+        return None
+
+    # Find the start of the last complete block.
+    # Every block is terminated by a `progress=continue` or `progress=end` line.
+    start = 0
+    end = None
+    for index in range(len(lines) - 1, -1, -1):
+        if lines[index].startswith('progress='):
+            if end is not None:
+                start = index + 1
+                break
+            end = index
+    if end is None:
+        return None
+
+    progress = {}
+    for line in lines[start:end + 1]:
+        key, _, value = line.partition('=')
+        progress[key.strip()] = value.strip()
+
+    return progress
+
+
+def is_finished(progress):
+    """Check whether ffmpeg has finished writing."""
+    return progress is not None and progress.get('progress') == 'end'
+
+
+def get_out_time(progress):
+    """Get the encoded media time in seconds."""
+    try:
+        return int(progress['out_time_us']) / 1000000
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def get_frames(progress):
+    """Get the number of encoded frames."""
+    try:
+        return int(progress['frame'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def get_total_size(progress):
+    """Get the number of bytes written so far."""
+    try:
+        return int(progress['total_size'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def get_speed(progress):
+    """Get the encoding speed as factor of realtime."""
+    try:
+        return float(progress['speed'].rstrip('x'))
+    except (KeyError, TypeError, AttributeError, ValueError):
+        return None
+
+
+def get_remaining_time(progress, duration):
+    """Estimate the remaining wall time of an encode in seconds."""
+    out_time = get_out_time(progress)
+    speed = get_speed(progress)
+    if out_time is None or not speed or duration is None:
+        return None
+
+    return max(0, duration - out_time) / speed
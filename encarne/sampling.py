@@ -0,0 +1,87 @@
+"""Prediction of the size of an encode by encoding short samples."""
+import os
+import shlex
+import subprocess
+
+from encarne.logger import Logger
+from encarne.metrics import metrics
+
+
+def predict_ratio(task, config):
+    """Predict the size of the encoded movie relative to the original.
+
+    A few samples are cut from the original without re-encoding, evenly spread over the movie,
+    and encoded with the configured settings. The video of the whole movie is expected to shrink
+    like the samples, all other streams are expected to keep their size.
+
+    The samples are always cut from the original, a staged copy might not exist yet.
+
+    Return `None`, if the movie can't be sampled.
+    """
+    count = int(config['encoding']['samples'])
+    length = float(config['encoding']['sample-length'])
+    if task.probe is None or task.probe.duration is None:
+        return None
+    duration = task.probe.duration.total_seconds()
+    if duration <= count * length:
+        return None
+
+    nice = config['default']['niceness']
+    sample_path = task.temp_path + '.sample-source.mkv'
+    encoded_path = task.temp_path + '.sample.mkv'
+    source_bytes = 0
+    encoded_bytes = 0
+    try:
+        size = os.path.getsize(task.origin_path)
+        # The scratch directory is only created, once the task is added to the executor.
+        os.makedirs(os.path.dirname(task.temp_path), exist_ok=True)
+        for index in range(count):
+            start = duration * (index + 1) / (count + 1) - length / 2
+            commands = [
+                'nice -n {nice} ffmpeg -y -v error -ss {start:.3f} -i {source} -t {length:.3f} '
+                '-map 0:v:0 -c copy {sample}'.format(
+                    nice=nice,
+                    start=start,
+                    source=shlex.quote(task.origin_path),
+                    length=length,
+                    sample=shlex.quote(sample_path),
+                ),
+                'nice -n {nice} ffmpeg -y -v error -i {sample} -map 0:v:0 {video} {encoded}'.format(
+                    nice=nice,
+                    sample=shlex.quote(sample_path),
+                    video=task.get_video_codec(config),
+                    encoded=shlex.quote(encoded_path),
+                ),
+            ]
+            for command in commands:
+                process = subprocess.run(
+                    command,
+                    shell=True,
+                    cwd=task.origin_folder,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.PIPE,
+                )
+                metrics.count('subprocesses')
+                if process.returncode != 0:
+                    Logger.info(f'Failed to encode a sample of {task.origin_path}: '
+                                f'{process.stderr.decode(errors="replace").strip()}')
+                    return None
+
+            source_bytes += os.path.getsize(sample_path)
+            encoded_bytes += os.path.getsize(encoded_path)
+            os.remove(sample_path)
+            os.remove(encoded_path)
+    except OSError as error:
+        Logger.info(f'Failed to sample {task.origin_path}: {error}')
+        return None
+    finally:
+        for path in [sample_path, encoded_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    if source_bytes == 0 or size == 0:
+        return None
+
+    # Extrapolate the size of the video stream from the samples.
+    video_size = min(size, source_bytes / (count * length) * duration)
+    return (size - video_size * (1 - encoded_bytes / source_bytes)) / size
@@ -0,0 +1,214 @@
+"""The sqlite model for the persistent scan cache."""
+import os
+import json
+from datetime import timedelta
+from sqlalchemy import Column, String, Float, Integer, Text, and_, or_
+
+from encarne.db import base
+from encarne.media import MediaProbe
+
+
+class ScanEntry(base):
+    """Cached probe results, hash and fingerprint of a file.
+
+    An entry is identified by the device and inode of a file. It is only valid
+    as long as size and mtime of the file didn't change since it has been probed.
+    """
+
+    __tablename__ = 'scan_cache'
+
+    device = Column(Integer(), primary_key=True, autoincrement=False)
+    inode = Column(Integer(), primary_key=True, autoincrement=False)
+    size = Column(Integer(), nullable=False)
+    mtime_ns = Column(Integer(), nullable=False)
+    path = Column(String(480), nullable=False, index=True)
+    encoding = Column(String(240))
+    codec = Column(String(40))
+    duration = Column(Float())
+    bitrate = Column(Integer())
+    width = Column(Integer())
+    height = Column(Integer())
+    streams = Column(Text())
+    sha1 = Column(String(40))
+    fingerprint = Column(String(40))
+
+    def __init__(self, stat, path):
+        """Create a new scan entry from the `os.stat` result of a file."""
+        self.device = stat.st_dev
+        self.inode = stat.st_ino
+        self.path = path
+        self.update(stat, path)
+
+    def update(self, stat, path):
+        """Reset the entry for a new version of the file."""
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.path = path
+        self.encoding = None
+        self.codec = None
+        self.duration = None
+        self.bitrate = None
+        self.width = None
+        self.height = None
+        self.streams = None
+        self.sha1 = None
+        self.fingerprint = None
+
+    def matches(self, stat):
+        """Check whether the file didn't change since it has been probed."""
+        return self.size == stat.st_size and self.mtime_ns == stat.st_mtime_ns
+
+    @property
+    def probe(self):
+        """Get the cached probe result or `None` if the file hasn't been probed yet."""
+        if self.streams is None:
+            return None
+
+        duration = None
+        if self.duration is not None:
+            duration = timedelta(seconds=self.duration)
+
+        return MediaProbe(
+            codec=self.codec,
+            writing_library=self.encoding,
+            duration=duration,
+            bitrate=self.bitrate,
+            width=self.width,
+            height=self.height,
+            streams=json.loads(self.streams),
+        )
+
+    @probe.setter
+    def probe(self, probe):
+        """Cache a probe result."""
+        self.encoding = probe.writing_library
+        self.codec = probe.codec
+        self.duration = None
+        if probe.duration is not None:
+            self.duration = probe.duration.total_seconds()
+        self.bitrate = probe.bitrate
+        self.width = probe.width
+        self.height = probe.height
+        self.streams = json.dumps(probe.streams)
+
+    @staticmethod
+    def load(session):
+        """Load all entries into a dict by device and inode."""
+        return {(entry.device, entry.inode): entry for entry in session.query(ScanEntry).all()}
+
+    @staticmethod
+    def get_or_create(session, path, stat, entries):
+        """Get the entry for a file from the loaded entries. A stale entry is reset."""
+        entry = entries.get((stat.st_dev, stat.st_ino))
+        if entry is None:
+            entry = ScanEntry(stat, path)
+            entries[(stat.st_dev, stat.st_ino)] = entry
+            session.add(entry)
+        elif not entry.matches(stat):
+            entry.update(stat, path)
+        else:
+            # The file might have been renamed or moved on the same device.
+            entry.path = path
+
+        return entry
+
+    @staticmethod
+    def invalidate(session, directory):
+        """Remove all cached entries below a directory."""
+        session.query(ScanEntry) \
+            .filter(ScanEntry.path.like(f'{directory}/%')) \
+            .delete(synchronize_session=False)
+        session.commit()
+
+    @staticmethod
+    def clean(session, chunk_size=100):
+        """Remove the entries of files, which have been deleted or replaced by another file.
+
+        A replaced file, e.g. an encoded movie, gets a new inode and therefore a new entry.
+        The entry of the old inode is superseded, once its path belongs to another inode.
+        Each directory is listed once instead of checking every file on its own.
+        If a directory doesn't exist anymore, all entries below it are deleted at once.
+        Return the number of removed entries.
+        """
+        directories = {}
+        for device, inode, path in session.query(ScanEntry.device, ScanEntry.inode, ScanEntry.path):
+            directories.setdefault(os.path.dirname(path), []).append((device, inode, os.path.basename(path)))
+
+        removed = 0
+        missing = []
+        for directory, entries in sorted(directories.items()):
+            # Entries below a missing directory have already been deleted with it.
+            if any(directory.startswith(f'{parent}/') for parent in missing):
+                continue
+
+            try:
+                device = os.stat(directory).st_dev
+                with os.scandir(directory) as listing:
+                    inodes = {entry.name: entry.inode() for entry in listing}
+            except (FileNotFoundError, NotADirectoryError):
+                missing.append(directory)
+                pattern = directory.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                removed += session.query(ScanEntry) \
+                    .filter(ScanEntry.path.like(f'{pattern}/%', escape='\\')) \
+                    .delete(synchronize_session=False)
+                continue
+            except OSError:
+                # Don't delete anything, if a directory can't be listed right now.
+                continue
+
+            stale = [(entry_device, inode) for entry_device, inode, name in entries
+                     if (entry_device, inode) != (device, inodes.get(name))]
+            for start in range(0, len(stale), chunk_size):
+                session.query(ScanEntry) \
+                    .filter(or_(*[and_(ScanEntry.device == entry_device, ScanEntry.inode == inode)
+                                  for entry_device, inode in stale[start:start + chunk_size]])) \
+                    .delete(synchronize_session=False)
+            removed += len(stale)
+        session.commit()
+
+        return removed
+
+
+class ScanDirectory(base):
+    """The remembered listing of a library directory."""
+
+    __tablename__ = 'scan_directory'
+
+    path = Column(String(480), primary_key=True)
+    mtime_ns = Column(Integer())
+    files = Column(Text(), nullable=False)
+    directories = Column(Text(), nullable=False)
+
+    @staticmethod
+    def load(session, directory):
+        """Load the listings of all directories of a library."""
+        rows = session.query(ScanDirectory) \
+            .filter((ScanDirectory.path == directory) | ScanDirectory.path.like(f'{directory}/%')) \
+            .all()
+
+        listings = {}
+        for row in rows:
+            listings[row.path] = (row.mtime_ns, json.loads(row.files), json.loads(row.directories))
+        return listings
+
+    @staticmethod
+    def store(session, directory, listings):
+        """Replace the listings of a library with the listings of the last walk."""
+        ScanDirectory.invalidate(session, directory)
+        session.bulk_insert_mappings(ScanDirectory, [
+            {
+                'path': path,
+                'mtime_ns': mtime_ns,
+                'files': json.dumps(files),
+                'directories': json.dumps(directories),
+            }
+            for path, (mtime_ns, files, directories) in listings.items()
+        ])
+        session.commit()
+
+    @staticmethod
+    def invalidate(session, directory):
+        """Remove the listings of all directories of a library."""
+        session.query(ScanDirectory) \
+            .filter((ScanDirectory.path == directory) | ScanDirectory.path.like(f'{directory}/%')) \
+            .delete(synchronize_session=False)
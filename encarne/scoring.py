@@ -0,0 +1,81 @@
+"""Estimation of the savings and the cost of encodes."""
+import statistics
+
+from encarne.logger import Logger
+
+
+class SavingsEstimator():
+    """Estimate the bytes saved and the cpu time of an encode from its probe.
+
+    The size of an encode is estimated by the bitrate x265 needs per pixel.
+    Its cpu time is estimated by the cpu time x265 needs per pixel and second of video.
+    Both start with rough defaults for x265's medium preset and are calibrated by
+    the previous encodes. The bitrate is calibrated per codec of the original,
+    as soon as enough encodes of a codec are known.
+    """
+
+    # Bits per second and pixel, about 2 Mbit/s for 1080p.
+    BITS_PER_PIXEL = 1.0
+    # Cpu seconds per pixel and second of video, about 12 cpu seconds per second of 1080p.
+    CPU_SECONDS_PER_PIXEL = 6e-6
+    # The number of encodes needed for calibration.
+    MIN_RUNS = 5
+
+    def __init__(self, runs):
+        """Calibrate the estimates with previous encode runs."""
+        bits_per_pixel = {}
+        cpu_seconds_per_pixel = []
+        for run in runs:
+            if not run.duration or not run.width or not run.height:
+                continue
+            pixel_seconds = run.width * run.height * run.duration
+            bits_per_pixel.setdefault(run.codec, []).append(run.size * 8 / pixel_seconds)
+            if run.encode_time and run.threads:
+                cpu_seconds_per_pixel.append(run.encode_time * run.threads / pixel_seconds)
+
+        all_bits_per_pixel = [value for values in bits_per_pixel.values() for value in values]
+        self.bits_per_pixel = self.calibrate(all_bits_per_pixel, self.BITS_PER_PIXEL)
+        self.codec_bits_per_pixel = {
+            codec: statistics.median(values)
+            for codec, values in bits_per_pixel.items()
+            if len(values) >= self.MIN_RUNS
+        }
+        self.cpu_seconds_per_pixel = self.calibrate(cpu_seconds_per_pixel, self.CPU_SECONDS_PER_PIXEL)
+
+        if len(all_bits_per_pixel) >= self.MIN_RUNS:
+            Logger.info(f'Estimating savings by {len(all_bits_per_pixel)} previous encodes')
+
+    def calibrate(self, values, default):
+        """Get the median of the values or the default, if there aren't enough."""
+        if len(values) < self.MIN_RUNS:
+            return default
+        return statistics.median(values)
+
+    def estimate(self, probe, size):
+        """Get the estimated bytes saved and cpu seconds of an encode.
+
+        Return `None`, if duration or resolution of the movie are unknown.
+        """
+        if probe is None or probe.duration is None or not probe.width or not probe.height:
+            return None
+
+        duration = probe.duration.total_seconds()
+        pixels = probe.width * probe.height
+        if duration <= 0:
+            return None
+
+        bitrate = probe.bitrate or size * 8 / duration
+        bits_per_pixel = self.codec_bits_per_pixel.get(probe.codec, self.bits_per_pixel)
+        ratio = min(1, bits_per_pixel * pixels / bitrate)
+
+        saved = size * (1 - ratio)
+        cpu_seconds = self.cpu_seconds_per_pixel * pixels * duration
+        return saved, cpu_seconds
+
+    def score(self, probe, size):
+        """Get the estimated bytes saved per cpu hour. Unknown movies score 0."""
+        estimate = self.estimate(probe, size)
+        if estimate is None:
+            return 0
+        saved, cpu_seconds = estimate
+        return saved / max(cpu_seconds / 3600, 1e-9)
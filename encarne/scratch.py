@@ -0,0 +1,125 @@
+"""Placement of the encoder output and moving it into the library."""
+import os
+import errno
+
+from encarne.logger import Logger
+
+# Errors of `copy_file_range` and `sendfile`, for which the next copy method is tried.
+FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP}
+CHUNK_SIZE = 1024 * 1024 * 1024
+
+
+def get_scratch_dir(scratch_dirs, path):
+    """Get the directory, in which a file is encoded.
+
+    `scratch_dirs` is a list of directories and `library=directory` mappings.
+    The mapping of the most specific library containing the file wins.
+    Otherwise the first plain directory is used and the home directory without any.
+    """
+    default = None
+    scratch_dir = None
+    longest = -1
+    for entry in scratch_dirs:
+        library, separator, directory = entry.partition('=')
+        if not separator:
+            if default is None:
+                default = entry
+            continue
+
+        library = os.path.abspath(os.path.expanduser(library.strip()))
+        if path.startswith(library.rstrip('/') + '/') and len(library) > longest:
+            scratch_dir = directory.strip()
+            longest = len(library)
+
+    if scratch_dir is None:
+        scratch_dir = default or '~'
+
+    return os.path.abspath(os.path.expanduser(scratch_dir))
+
+
+def move_file(source, target, stat):
+    """Atomically replace `target` by `source` and apply the permissions of `stat`.
+
+    Within a filesystem the file is simply renamed. Otherwise it's copied by the kernel
+    into a hidden file next to the target, synced and renamed over the target.
+    A crash leaves either the old or the new target, but never a partial one.
+    """
+    directory, name = os.path.split(target)
+    if os.stat(source).st_dev == os.stat(directory).st_dev:
+        set_permissions(source, stat)
+        os.replace(source, target)
+        return
+
+    temp_path = os.path.join(directory, f'.{name}.encarne')
+    try:
+        with open(source, 'rb') as source_file, open(temp_path, 'wb') as temp_file:
+            copy_file(source_file.fileno(), temp_file.fileno(), os.fstat(source_file.fileno()).st_size)
+            os.fsync(temp_file.fileno())
+        set_permissions(temp_path, stat)
+        os.replace(temp_path, target)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    sync_directory(directory)
+    os.remove(source)
+
+
+def copy_file(source_fd, target_fd, size):
+    """Copy a file without passing the data through userspace, if possible.
+
+    `copy_file_range` is tried first, `sendfile` second and a plain read/write loop last.
+    """
+    offset = 0
+    try:
+        while offset < size:
+            copied = os.copy_file_range(source_fd, target_fd, min(size - offset, CHUNK_SIZE), offset, offset)
+            if copied == 0:
+                return
+            offset += copied
+        return
+    except OSError as error:
+        if error.errno not in FALLBACK_ERRNOS:
+            raise
+
+    # `sendfile` writes at the current position of the target.
+    os.lseek(target_fd, offset, os.SEEK_SET)
+    try:
+        while offset < size:
+            copied = os.sendfile(target_fd, source_fd, offset, min(size - offset, CHUNK_SIZE))
+            if copied == 0:
+                return
+            offset += copied
+        return
+    except OSError as error:
+        if error.errno not in FALLBACK_ERRNOS:
+            raise
+
+    os.lseek(source_fd, offset, os.SEEK_SET)
+    os.lseek(target_fd, offset, os.SEEK_SET)
+    while True:
+        data = os.read(source_fd, 16 * 65536)
+        if not data:
+            return
+        view = memoryview(data)
+        while view:
+            view = view[os.write(target_fd, view):]
+
+
+def set_permissions(path, stat):
+    """Set the mode and the ownership of `stat` on a file."""
+    os.chmod(path, stat.st_mode)
+    try:
+        os.chown(path, stat.st_uid, stat.st_gid)
+    except PermissionError:
+        Logger.info("Failed to set ownership for {0}".format(path))
+
+
+def sync_directory(directory):
+    """Persist the entries of a directory, like a renamed file."""
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,155 @@
+"""Read-ahead staging of sources from slow storage to a local directory."""
+import os
+import hashlib
+import threading
+from collections import deque, OrderedDict
+
+from encarne.logger import Logger
+from encarne.scratch import copy_file
+
+
+class Stager():
+    """Copy the sources of upcoming encodes to a local staging directory.
+
+    Sources are staged in the order they are added by a worker thread, while other encodes run.
+    At most `prefetch` sources of unfinished encodes are staged at once and
+    all staged files together don't exceed `budget` bytes.
+    Released files are kept until their space is needed, the least recently used ones are evicted first.
+
+    A staged file is only a read copy. It's valid, as long as size and mtime of the original match.
+    """
+
+    def __init__(self, directory, budget, prefetch):
+        """Pick up the staged files of a previous run and start the worker."""
+        self.directory = directory
+        self.budget = budget
+        self.prefetch = max(1, prefetch)
+        os.makedirs(directory, exist_ok=True)
+
+        self.condition = threading.Condition()
+        self.queue = deque()
+        # The state of each added original: `queued`, `staged` or `failed`.
+        self.states = {}
+        # The size of all staged files in least recently used order.
+        self.files = OrderedDict()
+        # Staged files, which are used by unfinished encodes.
+        self.used = set()
+
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.partial'):
+                os.remove(entry.path)
+            elif entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_atime, entry.path, stat.st_size))
+        for _, path, size in sorted(entries):
+            self.files[path] = size
+
+        thread = threading.Thread(target=self.work, daemon=True)
+        thread.start()
+
+    def get_path(self, origin_path):
+        """Get the path of the staged copy of a file."""
+        name = hashlib.sha1(origin_path.encode()).hexdigest()[:16]
+        return os.path.join(self.directory, name + os.path.splitext(origin_path)[1])
+
+    def fits(self, size):
+        """Check whether a file of this size can be staged at all."""
+        return size <= self.budget
+
+    def add(self, origin_path):
+        """Stage a file after all previously added files."""
+        with self.condition:
+            self.states[origin_path] = 'queued'
+            self.queue.append(origin_path)
+            self.condition.notify_all()
+
+    def state(self, origin_path):
+        """Get the state of a file: `queued`, `staged` or `failed`."""
+        with self.condition:
+            return self.states.get(origin_path)
+
+    def release(self, origin_path):
+        """Allow the eviction of a staged file, once its encode has finished."""
+        with self.condition:
+            self.states.pop(origin_path, None)
+            path = self.get_path(origin_path)
+            self.used.discard(path)
+            if path in self.files:
+                self.files.move_to_end(path)
+            self.condition.notify_all()
+
+    def work(self):
+        """Stage the queued files one after another."""
+        while True:
+            with self.condition:
+                while not self.queue or len(self.used) >= self.prefetch:
+                    self.condition.wait()
+                origin_path = self.queue.popleft()
+                path = self.get_path(origin_path)
+
+            try:
+                state = self.stage(origin_path, path)
+            except OSError as error:
+                Logger.warning(f'Failed to stage {origin_path}: {error}')
+                state = 'failed'
+
+            with self.condition:
+                if origin_path in self.states:
+                    self.states[origin_path] = state
+
+    def stage(self, origin_path, path):
+        """Copy a file into the staging directory, unless there is a valid copy already."""
+        stat = os.stat(origin_path)
+        with self.condition:
+            self.used.add(path)
+            size = self.files.pop(path, None)
+
+        if size is not None:
+            try:
+                staged = os.stat(path)
+                if staged.st_size == stat.st_size and staged.st_mtime_ns == stat.st_mtime_ns:
+                    with self.condition:
+                        self.files[path] = size
+                    return 'staged'
+                os.remove(path)
+            except OSError:
+                pass
+
+        self.reserve(path, stat.st_size)
+        partial_path = path + '.partial'
+        try:
+            with open(origin_path, 'rb') as source, open(partial_path, 'wb') as target:
+                os.posix_fadvise(source.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                copy_file(source.fileno(), target.fileno(), stat.st_size)
+            os.utime(partial_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            os.replace(partial_path, path)
+        except BaseException:
+            with self.condition:
+                self.files.pop(path, None)
+                self.used.discard(path)
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+
+        Logger.debug(f'Staged {origin_path}')
+        return 'staged'
+
+    def reserve(self, path, size):
+        """Evict the least recently used released files, until a file of this size fits."""
+        with self.condition:
+            while True:
+                evictable = [staged for staged in self.files if staged not in self.used]
+                while sum(self.files.values()) + size > self.budget and evictable:
+                    evicted = evictable.pop(0)
+                    del self.files[evicted]
+                    try:
+                        os.remove(evicted)
+                    except OSError:
+                        pass
+                if sum(self.files.values()) + size <= self.budget:
+                    break
+                # Wait for a running encode to release its file.
+                self.condition.wait()
+
+            self.files[path] = size
@@ -1,40 +1,220 @@
 """Show some statistics about encarne."""
 import os
-import humanfriendly
+import sys
+import json
+from collections import defaultdict
+from sqlalchemy import Table, Column, MetaData, String, and_, case, exists, func, select
 
 from encarne.movie import Movie
+from encarne.scan_cache import ScanEntry
+from encarne.encode_run import EncodeRun
 from encarne.logger import Logger
-from encarne.db import get_session
+from encarne.db import get_session, create_db, is_migrated
 
 
 def show_stats(args):
-    """Print how much has already been saved by reencoding."""
+    """Print how much has already been saved by reencoding and the encoding throughput.
+
+    All totals are aggregated by the database.
+    Movies, which don't exist in the file system anymore, are only excluded with `--check-files`.
+    The database is only read, so monitoring may run this without write access.
+    """
+    if not is_migrated():
+        Logger.error('The database is outdated, run `encarne clean` once to migrate it')
+        sys.exit(1)
     session = get_session()
-    movies = session.query(Movie).all()
-
-    saved = 0
-    failed = 0
-    encoded = 0
-    for movie in movies:
-        # Only count movies which exist in the file system.
-        path = os.path.join(movie.directory, movie.name)
-        if not os.path.exists(path):
-            continue
-
-        diff = movie.original_size - movie.size
-        if movie.failed:
-            failed += 1
-        elif movie.encoded and diff > 0:
-            saved += diff
-            encoded += 1
-
-    saved_formatted = humanfriendly.format_size(saved)
+
+    condition = None
+    if args['check_files']:
+        condition = exclude_missing_movies(session)
+
+    stats = get_stats(session, condition, args['by_directory'])
+    stats['throughput'] = get_throughput(session.query(EncodeRun).all())
+
+    if args['json']:
+        json.dump(stats, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return
+
+    # Only imported for human readable output, monitoring usually asks for JSON.
+    import humanfriendly
+    saved_formatted = humanfriendly.format_size(stats['saved'])
     Logger.info(f'Saved space: {saved_formatted}')
-    Logger.info(f'Reencoded container: {encoded}')
-    Logger.info(f'Failed movies: {failed}')
+    Logger.info(f'Reencoded container: {stats["reencoded"]}')
+    Logger.info(f'Failed movies: {stats["status"].get("failed", {}).get("movies", 0)}')
+    for group in ['status', 'codec', 'directory']:
+        for key, values in stats.get(group, {}).items():
+            Logger.info(f'{group} {key}: {values["movies"]} movies, '
+                        f'{humanfriendly.format_size(values["size"])}, '
+                        f'saved {humanfriendly.format_size(values["saved"])}')
+    log_throughput(stats['throughput'])
+
+
+def get_stats(session, condition=None, by_directory=False):
+    """Aggregate the movies by status, codec and, optionally, directory."""
+    status = case([(Movie.failed, 'failed'), (Movie.encoded, 'encoded')], else_='pending')
+    # A replaced file leaves the entry of its old inode behind, until `encarne clean` runs.
+    # The current entry has the size of the movie, the newest one wins.
+    codec = select([ScanEntry.codec]) \
+        .where(and_(ScanEntry.path == Movie.directory + '/' + Movie.name, ScanEntry.size == Movie.size)) \
+        .order_by(ScanEntry.mtime_ns.desc()) \
+        .limit(1) \
+        .as_scalar()
+    # Movies, which are already encoded, are marked as encoded without being reencoded.
+    is_reencoded = and_(Movie.encoded, ~Movie.failed, Movie.original_size > Movie.size)
+    saved = func.sum(case([(is_reencoded, Movie.original_size - Movie.size)], else_=0))
+    reencoded = func.sum(case([(is_reencoded, 1)], else_=0))
+    aggregates = [
+        func.count(),
+        func.coalesce(func.sum(Movie.size), 0),
+        func.coalesce(saved, 0),
+        func.coalesce(reencoded, 0),
+    ]
+
+    def group(column):
+        query = session.query(column, *aggregates)
+        if condition is not None:
+            query = query.filter(condition)
+        return {
+            key if key is not None else 'unknown': {'movies': movies, 'size': size, 'saved': saved, 'reencoded': reencoded}
+            for key, movies, size, saved, reencoded in query.group_by(column).all()
+        }
+
+    stats = {
+        'status': group(status.label('status')),
+        'codec': group(func.coalesce(codec, 'unknown').label('codec')),
+    }
+    if by_directory:
+        stats['directory'] = group(Movie.directory)
+    stats['movies'] = sum(values['movies'] for values in stats['status'].values())
+    stats['saved'] = sum(values['saved'] for values in stats['status'].values())
+    stats['reencoded'] = sum(values['reencoded'] for values in stats['status'].values())
+
+    return stats
+
+
+def exclude_missing_movies(session):
+    """Find all movies, which don't exist in the file system anymore.
+
+    Each directory is listed once, instead of checking every single file.
+    The missing movies are stored in a temporary table.
+    Return a condition, which excludes them.
+    """
+    names = defaultdict(list)
+    for directory, name in session.query(Movie.directory, Movie.name):
+        names[directory].append(name)
+
+    missing = []
+    for directory, directory_names in names.items():
+        try:
+            with os.scandir(directory) as entries:
+                existing = {entry.name for entry in entries}
+        except OSError:
+            existing = set()
+        missing.extend({'directory': directory, 'name': name}
+                       for name in directory_names if name not in existing)
+
+    table = Table(
+        'missing_movie', MetaData(),
+        Column('directory', String(240)),
+        Column('name', String(240)),
+        prefixes=['TEMPORARY'],
+    )
+    connection = session.connection()
+    table.create(connection)
+    if missing:
+        connection.execute(table.insert(), missing)
+
+    return ~exists().where(and_(table.c.directory == Movie.directory, table.c.name == Movie.name))
+
+
+def get_throughput(runs):
+    """Get percentiles of the encoding throughput and the cpu time per saved GiB."""
+    settings = defaultdict(list)
+    for run in runs:
+        settings[(run.preset, run.crf, run.threads)].append(run)
+
+    throughput = get_run_percentiles(runs)
+    throughput['settings'] = []
+    for (preset, crf, threads), setting_runs in sorted(settings.items(), key=str):
+        setting = {'preset': preset, 'crf': crf, 'threads': threads}
+        setting.update(get_run_percentiles(setting_runs))
+        throughput['settings'].append(setting)
+
+    return throughput
+
+
+def get_run_percentiles(runs):
+    """Get the percentiles of fps, speed and cpu seconds per saved GiB of some encodes."""
+    fps = [run.fps for run in runs if run.fps]
+    speed = [run.duration / run.encode_time for run in runs if run.duration and run.encode_time]
+    costs = [cost for cost in map(get_cost, runs) if cost is not None]
+    return {
+        'encodes': len(runs),
+        'fps': get_percentiles(fps),
+        'speed': get_percentiles(speed),
+        'cpu_seconds_per_gib': get_percentiles(costs),
+    }
+
+
+def log_throughput(throughput):
+    """Log the encoding throughput."""
+    import humanfriendly
+    if throughput['encodes'] == 0:
+        return
+
+    Logger.info(f'Recorded encodes: {throughput["encodes"]}')
+    log_percentiles('Frames per second', throughput['fps'], lambda fps: f'{fps:.1f}')
+    log_percentiles('Speed', throughput['speed'], lambda speed: f'{speed:.2f}x')
+    log_percentiles('Cpu time per GiB saved', throughput['cpu_seconds_per_gib'], humanfriendly.format_timespan)
+
+    # Compare the encoding settings.
+    if len(throughput['settings']) > 1:
+        for setting in throughput['settings']:
+            message = f'preset {setting["preset"]}, crf {setting["crf"]}, {setting["threads"]} threads: ' \
+                f'{setting["encodes"]} encodes'
+            if setting['fps']:
+                message += f', median {setting["fps"]["p50"]:.1f} fps'
+            if setting['cpu_seconds_per_gib']:
+                message += f', median {humanfriendly.format_timespan(setting["cpu_seconds_per_gib"]["p50"])} per GiB saved'
+            Logger.info(message)
+
+
+def get_cost(run):
+    """Get the cpu seconds per saved GiB of an encode or `None`, if it's unknown."""
+    saved = run.original_size - run.size
+    if run.user_time is None or run.system_time is None or saved <= 0:
+        return None
+    return (run.user_time + run.system_time) / (saved / 1024**3)
+
+
+def get_percentiles(values):
+    """Get the nearest-rank 10th, 50th and 90th percentile of some values."""
+    if len(values) == 0:
+        return {}
+    values = sorted(values)
+    return {f'p{percentile}': values[min(len(values) - 1, len(values) * percentile // 100)]
+            for percentile in [10, 50, 90]}
+
+
+def log_percentiles(name, percentiles, format_value):
+    """Log the percentiles of some values."""
+    if not percentiles:
+        return
+    Logger.info(f'{name}: ' + ', '.join(f'{key} {format_value(value)}' for key, value in percentiles.items()))
 
 
 def clean_movies(args):
-    """Remove movies from db, which don't exist in the filesystem anymore."""
+    """Remove movies and scan cache entries from db, which don't exist in the filesystem anymore."""
+    create_db()
     session = get_session()
     Movie.clean_movies(session)
+    removed = ScanEntry.clean(session)
+    Logger.info(f'Removed {removed} stale scan cache entries')
+
+
+def hash_movies(args):
+    """Compute the sha1 of all movies, which haven't been hashed yet."""
+    create_db()
+    session = get_session()
+    Movie.hash_movies(session)
@@ -1,51 +1,277 @@
 """Representation of a task."""
 import os
+import math
 import shlex
+import shutil
+
+from encarne.progress import read_progress, get_speed, get_frames
+
+
+class Segment():
+    """A part of a movie, which is encoded on its own."""
+
+    __slots__ = (
+        'index',
+        'start',
+        'duration',
+        'path',
+        'progress_path',
+        'command',
+    )
+
+    def __init__(self, index, start, duration, directory):
+        """Create a new segment.
+
+        `duration` is `None` for the last segment, which is encoded until the end.
+        """
+        self.index = index
+        self.start = start
+        self.duration = duration
+        self.path = os.path.join(directory, f'{index:04d}.mkv')
+        self.progress_path = self.path + '.progress'
+        self.command = None
 
 
 class Task():
-    """Representation of a task."""
+    """Representation of a task.
+
+    A task is either encoded by a single ffmpeg command or split into segments.
+    Segments are encoded in parallel and joined by the final `ffmpeg_command`,
+    which also copies audio and subtitles from the original.
+    """
+
+    __slots__ = (
+        'origin_path',
+        'source_path',
+        'origin_folder',
+        'origin_file',
+        'probe',
+        'movie',
+        'temp_path',
+        'progress_path',
+        'segment_dir',
+        'segments',
+        'target_path',
+        'ffmpeg_command',
+        'layout',
+    )
+
+    def __init__(self, path, config, probe=None, layout=None, scratch_dir=None, source_path=None):
+        """Create a new task.
 
-    def __init__(self, path, config):
-        """Create a new task."""
+        A planned `layout` overrides the configured thread count.
+        The movie is encoded in `scratch_dir`, which defaults to the home directory.
+        ffmpeg reads from `source_path`, e.g. a staged copy, which defaults to the original.
+        """
         self.origin_path = path
+        self.source_path = source_path or path
         self.origin_folder = os.path.dirname(path)
         self.origin_file = os.path.basename(path)
+        self.probe = probe
+        self.movie = None
+        self.layout = layout
 
-        self.set_encoding_paths()
+        self.set_encoding_paths(scratch_dir or os.path.expanduser('~'))
+        self.set_segments(config)
         self.set_command(config)
 
-    def set_encoding_paths(self):
-        """Get the temp dir for encoding and the name for the new encoded video file."""
-        home = os.path.expanduser('~')
-
+    def set_encoding_paths(self, scratch_dir):
+        """Get the temp paths for encoding and the name for the new encoded video file."""
         # Remove any x264 from file_name
         cleand_name = self.origin_file.replace('-x264', '').replace('_x264', '').replace('x264', '')
-        self.temp_path = os.path.join(home, cleand_name)
+        self.temp_path = os.path.join(scratch_dir, cleand_name)
         self.temp_path = os.path.splitext(self.temp_path)[0] + '.mkv'
+        self.progress_path = self.temp_path + '.progress'
+        self.segment_dir = self.temp_path + '.segments'
 
         self.target_path = os.path.join(
             self.origin_folder,
             os.path.basename(self.temp_path),
         )
 
+    def set_segments(self, config):
+        """Split the movie into `segments` parts of equal length.
+
+        With a `segment-length`, the movie is split into parts of at most this many seconds.
+        Finished segments are kept, if an encode is interrupted.
+
+        The segments are cut by accurate input seeking, which decodes from the
+        previous keyframe. The encoded segments therefore join without gaps,
+        no matter where the keyframes of the original are.
+        """
+        self.segments = []
+        if self.probe is None or self.probe.duration is None:
+            return
+
+        total = self.probe.duration.total_seconds()
+        count = int(config['encoding']['segments'])
+        segment_length = float(config['encoding']['segment-length'])
+        if segment_length > 0:
+            count = max(count, math.ceil(total / segment_length))
+        if count <= 1:
+            return
+
+        length = total / count
+        for index in range(count):
+            duration = length if index < count - 1 else None
+            self.segments.append(Segment(index, index * length, duration, self.segment_dir))
+
     def set_command(self, config):
-        """Compile and set the ffmpeg command for pueue."""
+        """Compile and set the ffmpeg commands for the executor."""
         audio_codec = ''
         if config['encoding']['audio'] != 'None':
             audio_codec = f"-map 0:a -c:a {config['encoding']['audio']}"
+            if self.segments:
+                # Audio is taken from the original, which is the second input of the join.
+                audio_codec = f"-c:a {config['encoding']['audio']}"
 
         if audio_codec != '':
             if config['encoding']['kbitrate-audio'] != 'None':
                 audio_codec += f" -b:a {config['encoding']['kbitrate-audio']}"
 
-        self.ffmpeg_command = 'nice -n {nice} ffmpeg -i {path} -map 0 -c copy {audio} -c:v libx265 -preset {preset} ' \
-            '-x265-params crf={crf}:pools=none -threads {threads} {dest}'.format(
-                path=shlex.quote(self.origin_path),
+        video_codec = self.get_video_codec(config)
+        nice = config['default']['niceness']
+
+        for segment in self.segments:
+            duration = ''
+            if segment.duration is not None:
+                duration = f'-t {segment.duration:.3f}'
+
+            segment.command = 'nice -n {nice} ffmpeg -ss {start:.3f} -i {path} {duration} -map 0:v:0 {video} ' \
+                '-progress {progress} {dest}'.format(
+                    nice=nice,
+                    start=segment.start,
+                    path=shlex.quote(self.source_path),
+                    duration=duration,
+                    video=video_codec,
+                    progress=shlex.quote(segment.progress_path),
+                    dest=shlex.quote(segment.path),
+                )
+
+        if self.segments:
+            self.ffmpeg_command = 'nice -n {nice} ffmpeg -f concat -safe 0 -i {segments} -i {path} ' \
+                '-map 0:v -map 1 -map -1:v -map_metadata 1 -map_chapters 1 -c copy {audio} ' \
+                '-progress {progress} {dest}'.format(
+                    nice=nice,
+                    segments=shlex.quote(self.segment_list_path),
+                    path=shlex.quote(self.source_path),
+                    audio=audio_codec,
+                    progress=shlex.quote(self.progress_path),
+                    dest=shlex.quote(self.temp_path),
+                )
+            return
+
+        self.ffmpeg_command = 'nice -n {nice} ffmpeg -i {path} -map 0 -c copy {audio} {video} ' \
+            '-progress {progress} {dest}'.format(
+                path=shlex.quote(self.source_path),
                 dest=shlex.quote(self.temp_path),
-                nice=config['default']['niceness'],
-                preset=config['encoding']['preset'],
-                crf=config['encoding']['crf'],
-                threads=config['encoding']['threads'],
+                progress=shlex.quote(self.progress_path),
+                nice=nice,
+                video=video_codec,
                 audio=audio_codec,
             )
+
+    def get_video_codec(self, config):
+        """Get the ffmpeg options of the video encoder."""
+        x265_params = f"crf={config['encoding']['crf']}:pools=none"
+        threads = config['encoding']['threads']
+        if self.layout is not None:
+            x265_params = f"crf={config['encoding']['crf']}:pools={self.layout.threads}:frame-threads={self.layout.frame_threads}"
+            threads = self.layout.threads
+
+        return '-c:v libx265 -preset {preset} -x265-params {x265_params} -threads {threads}'.format(
+            preset=config['encoding']['preset'],
+            x265_params=x265_params,
+            threads=threads,
+        )
+
+    def set_source(self, path, config):
+        """Read from another copy of the original."""
+        self.source_path = path
+        self.set_command(config)
+
+    @property
+    def segment_list_path(self):
+        """The concat demuxer's list of all segments."""
+        return os.path.join(self.segment_dir, 'segments.txt')
+
+    def prepare_segments(self):
+        """Create the segment directory and the list for the concat demuxer."""
+        os.makedirs(self.segment_dir, exist_ok=True)
+        with open(self.segment_list_path, 'w') as segment_list:
+            for segment in self.segments:
+                path = segment.path.replace("'", "'\\''")
+                segment_list.write(f"file '{path}'\n")
+
+    def remove_segment(self, segment):
+        """Remove the encoded file and the progress file of a segment."""
+        for path in [segment.path, segment.progress_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def remove_output(self):
+        """Remove the encoded file and its progress file, if they exist."""
+        for path in [self.temp_path, self.progress_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def remove_temp_files(self):
+        """Remove the encoded file, all segments and the progress files, if they exist."""
+        self.remove_output()
+        if os.path.exists(self.segment_dir):
+            shutil.rmtree(self.segment_dir)
+
+    @property
+    def progress_files(self):
+        """All progress files of this task with the media duration, they cover."""
+        files = []
+        duration = None
+        if self.probe is not None and self.probe.duration is not None:
+            duration = self.probe.duration.total_seconds()
+
+        for segment in self.segments:
+            segment_duration = segment.duration
+            if segment_duration is None and duration is not None:
+                segment_duration = duration - segment.start
+            files.append((segment.progress_path, segment_duration))
+
+        # The join only copies streams, its duration is irrelevant for the estimate.
+        if self.segments:
+            files.append((self.progress_path, None))
+        else:
+            files.append((self.progress_path, duration))
+
+        return files
+
+    @property
+    def encode_time(self):
+        """The summed wall time of all encoding processes in seconds, as reported by ffmpeg."""
+        total = 0
+        for path, duration in self.progress_files:
+            if duration is None:
+                continue
+            speed = get_speed(read_progress(path))
+            if not speed:
+                return None
+            total += duration / speed
+        return total
+
+    @property
+    def frames(self):
+        """The number of encoded frames, as reported by ffmpeg."""
+        total = 0
+        for path, duration in self.progress_files:
+            if duration is None:
+                continue
+            frames = get_frames(read_progress(path))
+            if frames is None:
+                return None
+            total += frames
+        return total
+
+    @property
+    def slots(self):
+        """The number of cpu slots of the local executor, which this task occupies."""
+        if self.layout is None:
+            return 1
+        return self.layout.threads
@@ -0,0 +1,96 @@
+"""Library traversal."""
+import os
+import time
+import fnmatch
+
+from encarne.metrics import metrics
+
+
+class LibraryWalker():
+    """Find all video files of a library in a single traversal.
+
+    The listing of each directory is remembered together with the directory's mtime.
+    An unchanged directory isn't listed again, its remembered listing is used instead.
+    As the mtime of a directory only changes, if its direct entries change,
+    the remembered subdirectories are still checked on their own.
+    """
+
+    def __init__(self, extensions, excludes=None, skip_hidden=True, listings=None):
+        """Create a new walker.
+
+        `listings` maps directory paths to the `(mtime_ns, files, directories)`
+        of a previous walk.
+        """
+        self.extensions = tuple(f'.{extension.lower()}' for extension in extensions)
+        self.excludes = excludes or []
+        self.skip_hidden = skip_hidden
+        self.listings = listings or {}
+
+        # The listings of all directories visited by this walk.
+        self.visited = {}
+        self.listed = 0
+
+    def walk(self, directory):
+        """Yield the paths of all matching files below a directory."""
+        pending = [directory]
+        while pending:
+            current = pending.pop()
+            try:
+                with metrics.phase('walk'):
+                    files, directories = self.list_directory(current)
+            except OSError:
+                continue
+
+            for name in files:
+                path = os.path.join(current, name)
+                if not self.is_excluded(name, path):
+                    yield path
+
+            # Reverse the directories, to visit them in alphabetical order.
+            for name in reversed(directories):
+                path = os.path.join(current, name)
+                if self.is_skipped(name) or self.is_excluded(name, path):
+                    continue
+                pending.append(path)
+
+    def list_directory(self, directory):
+        """Get all matching files and all subdirectories of a directory."""
+        mtime_ns = os.stat(directory).st_mtime_ns
+        listing = self.listings.get(directory)
+        if listing is not None and listing[0] == mtime_ns:
+            self.visited[directory] = listing
+            return listing[1], listing[2]
+
+        files = []
+        directories = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        directories.append(entry.name)
+                    elif entry.is_file() and entry.name.lower().endswith(self.extensions):
+                        files.append(entry.name)
+                except OSError:
+                    continue
+        files.sort()
+        directories.sort()
+        self.listed += 1
+
+        # Changes within the same timestamp granularity wouldn't be noticed.
+        # Don't remember the mtime of directories, which have just been modified.
+        if time.time_ns() - mtime_ns < 2 * 10**9:
+            mtime_ns = None
+        self.visited[directory] = (mtime_ns, files, directories)
+
+        return files, directories
+
+    def is_skipped(self, name):
+        """Check whether a directory is hidden or a NAS metadata directory like `@eaDir`."""
+        return self.skip_hidden and name.startswith(('.', '@'))
+
+    def is_excluded(self, name, path):
+        """Check whether a file or directory matches any exclude glob."""
+        for pattern in self.excludes:
+            if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(path, pattern):
+                return True
+        return False
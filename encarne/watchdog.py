@@ -0,0 +1,47 @@
+"""Supervision of the output size of running encodes."""
+from encarne.progress import read_progress, get_out_time, get_total_size
+
+
+class SizeWatchdog():
+    """Project the final size of running encodes by their progress.
+
+    The bytes written so far are extrapolated by the share of the movie, which has been encoded.
+    A projection is only trusted, once `min_progress` of the movie has been encoded,
+    as the start of a movie isn't necessarily representative.
+    """
+
+    def __init__(self, margin, min_progress=0.1):
+        """Create a new watchdog, which tolerates `margin` more than the original size."""
+        self.margin = margin
+        self.min_progress = min_progress
+
+    def project(self, task):
+        """Get the projected size of the encoded video or `None`, if it's too early to tell."""
+        written = 0
+        encoded = 0
+        total = 0
+        for path, duration in task.progress_files:
+            # The join of segments only copies streams.
+            if duration is None:
+                continue
+            total += duration
+
+            progress = read_progress(path)
+            out_time = get_out_time(progress)
+            size = get_total_size(progress)
+            if out_time and size:
+                written += size
+                encoded += min(out_time, duration)
+
+        if total == 0 or encoded < self.min_progress * total:
+            return None
+
+        return written / encoded * total
+
+    def is_oversized(self, task, original_size):
+        """Check whether an encode is projected to clearly exceed the original size."""
+        if not original_size:
+            return False
+
+        projected = self.project(task)
+        return projected is not None and projected > original_size * (1 + self.margin)
@@ -0,0 +1,79 @@
+"""Notice finished encodes as soon as possible."""
+import os
+import time
+
+from encarne.progress import read_progress, is_finished, get_remaining_time
+
+MAX_POLL_INTERVAL = 60
+
+
+class CompletionWatcher():
+    """Watch for hints, that a task might have finished.
+
+    Asking pueue for its status is a socket round trip, while these hints
+    are cheap local checks. Pueue rewrites its queue file on every status change
+    and ffmpeg ends its progress file with `progress=end`.
+    """
+
+    def __init__(self, queue_path):
+        """Create a new watcher for the given pueue queue file."""
+        self.queue_path = queue_path
+        self.queue_mtime = get_mtime(queue_path)
+        # The finished progress files, which have already been reported.
+        # Segments of a task finish one after another, each of them is only reported once.
+        self.finished = set()
+
+    def poll(self, tasks):
+        """Check whether any task might have finished since the last call."""
+        changed = False
+        mtime = get_mtime(self.queue_path)
+        if mtime != self.queue_mtime:
+            self.queue_mtime = mtime
+            changed = True
+
+        finished = set()
+        for task in tasks:
+            for path, _ in task.progress_files:
+                if is_finished(read_progress(path)):
+                    finished.add(path)
+
+        # Progress files, which are gone or have been restarted, may be reported again.
+        if finished - self.finished:
+            changed = True
+        self.finished = finished
+
+        return changed
+
+    def wait(self, tasks, timeout):
+        """Wait until a task might have finished or the timeout is reached."""
+        deadline = time.time() + timeout
+        while not self.poll(tasks):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(1, remaining))
+
+        return True
+
+
+def get_poll_interval(tasks):
+    """Get the time to wait, before pueue is asked again without any hint.
+
+    The interval shrinks with the expected remaining time of the running encodes.
+    """
+    interval = MAX_POLL_INTERVAL
+    for task in tasks:
+        for path, duration in task.progress_files:
+            remaining = get_remaining_time(read_progress(path), duration)
+            if remaining is not None:
+                interval = min(interval, max(1, remaining / 2))
+
+    return interval
+
+
+def get_mtime(path):
+    """Get the mtime of a file or `None`, if it doesn't exist."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
@@ -10,19 +10,19 @@ setup(
     keywords='bash command service',
     url='http://github.com/nukesor/encarne',
     license='MIT',
+    python_requires='>=3.9',
     install_requires=[
         'pueue',
         'lxml',
         'humanfriendly',
         'SQLAlchemy',
-        'sqlalchemy-utils',
     ],
     classifiers=[
         'License :: OSI Approved :: MIT License',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.9',
         'Environment :: Console',
     ],
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks*']),
     entry_points={
         'console_scripts': [
             'encarne=encarne:main',
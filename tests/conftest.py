@@ -0,0 +1,38 @@
+"""Shared fixtures of the tests.
+
+The database engine is created, once `encarne.db` is imported,
+so the database has to be moved before any encarne module is imported.
+"""
+import os
+import tempfile
+
+import pytest
+
+os.environ['ENCARNE_DATABASE'] = os.path.join(tempfile.mkdtemp(prefix='encarne-tests-'), 'encarne.db')
+
+from encarne.db import base, create_db, get_session  # noqa: E402
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    """Replace ffmpeg by the stand-in in `tests/bin`."""
+    directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin')
+    monkeypatch.setenv('PATH', directory + os.pathsep + os.environ.get('PATH', ''))
+
+
+@pytest.fixture
+def session():
+    """Get a session of an empty database."""
+    create_db()
+    session = get_session()
+    yield session
+    session.remove()
+    base.metadata.drop_all()
+
+
+def create_file(path, size=1024, content=None):
+    """Create a file with unique content of the given size."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file_descriptor:
+        file_descriptor.write(content if content is not None else os.urandom(size))
+    return path
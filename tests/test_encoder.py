@@ -0,0 +1,99 @@
+"""Tests of the scheduling of tasks."""
+import os
+import configparser
+from datetime import timedelta
+
+from encarne.encoder import Encoder
+from encarne.media import MediaProbe
+from encarne.movie import Movie
+from encarne.task import Task
+
+from conftest import create_file
+
+
+class FakeExecutor():
+    """An executor, whose job states are set by the test."""
+
+    def __init__(self):
+        """Create an executor without any jobs."""
+        self.jobs = {}
+        self.added = []
+
+    def status(self, command):
+        """Get the status of a job."""
+        return self.jobs.get(command)
+
+    def add(self, command, path, slots=1):
+        """Queue a job."""
+        self.jobs[command] = 'queued'
+        self.added.append(command)
+
+
+def create_encoder(session, tmp_path):
+    """Create an encoder without any of its side effects."""
+    encoder = Encoder.__new__(Encoder)
+    encoder.config = configparser.ConfigParser()
+    encoder.config.read_dict(encoder.default_config())
+    encoder.config['encoding']['segment-length'] = '60'
+    encoder.config['encoding']['watchdog'] = 'False'
+    encoder.session = session
+    encoder.executor = FakeExecutor()
+    encoder.checkpoints = {}
+    encoder.watchdog = None
+    return encoder
+
+
+def create_task(encoder, tmp_path):
+    """Create a task of three segments."""
+    path = create_file(str(tmp_path / 'library' / 'movie.mkv'))
+    probe = MediaProbe(codec='AVC', duration=timedelta(seconds=180))
+    task = Task(path, encoder.config, probe, scratch_dir=str(tmp_path / 'scratch'))
+    task.movie = Movie(None, 'movie.mkv', os.path.dirname(path), 1024)
+    return task
+
+
+def test_lost_segments_are_encoded_again(session, tmp_path):
+    """Segments, which the executor lost, are added again and finished segments are kept."""
+    encoder = create_encoder(session, tmp_path)
+    task = create_task(encoder, tmp_path)
+    assert len(task.segments) == 3
+
+    encoder.add_task(task)
+    assert encoder.executor.added == [segment.command for segment in task.segments]
+
+    # The first segment is done, the others are lost by an executor reset.
+    first = task.segments[0]
+    create_file(first.path)
+    encoder.executor.jobs = {first.command: 'done'}
+    encoder.executor.added = []
+
+    assert not encoder.is_task_done(task)
+    assert not task.movie.failed
+    assert os.path.exists(first.path)
+    assert encoder.executor.added == [segment.command for segment in task.segments[1:]]
+    assert first.path in encoder.checkpoints
+
+
+def test_failed_segment_fails_task(session, tmp_path):
+    """A failed segment fails the whole task."""
+    encoder = create_encoder(session, tmp_path)
+    task = create_task(encoder, tmp_path)
+    encoder.add_task(task)
+    encoder.executor.jobs[task.segments[1].command] = 'failed'
+
+    assert encoder.is_task_done(task)
+    assert task.movie.failed
+    assert not os.path.exists(task.segment_dir)
+
+
+def test_segments_are_joined(session, tmp_path):
+    """The segments are joined, once all of them are done."""
+    encoder = create_encoder(session, tmp_path)
+    task = create_task(encoder, tmp_path)
+    encoder.add_task(task)
+    for segment in task.segments:
+        create_file(segment.path)
+        encoder.executor.jobs[segment.command] = 'done'
+
+    assert not encoder.is_task_done(task)
+    assert encoder.executor.added[-1] == task.ffmpeg_command
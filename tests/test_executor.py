@@ -0,0 +1,237 @@
+"""Tests of the local executor with the ffmpeg stand-in."""
+import os
+import time
+import shlex
+import signal
+import subprocess
+
+import pytest
+
+from encarne.executor import LocalExecutor, get_process_start, is_alive, is_same_process
+from encarne.job import Job
+
+from conftest import create_file
+
+
+def get_command(tmp_path, name):
+    """Get an ffmpeg command, which encodes a movie of the temp directory."""
+    source = create_file(str(tmp_path / f'{name}.mkv'), size=1000)
+    return 'ffmpeg -i {source} -progress {progress} {dest}'.format(
+        source=shlex.quote(source),
+        progress=shlex.quote(str(tmp_path / f'{name}.progress')),
+        dest=shlex.quote(str(tmp_path / f'{name}.x265.mkv')),
+    )
+
+
+def wait_for(executor, command, states, timeout=10):
+    """Wait until a job reached any of the given states."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        executor.refresh()
+        if executor.status(command) in states:
+            return executor.status(command)
+        executor.wait([], 0.1)
+    pytest.fail(f'Job is still {executor.status(command)}')
+
+
+def test_add(session, fake_ffmpeg, tmp_path):
+    """A job is run and its result and resource usage are persisted."""
+    executor = LocalExecutor(session, 2)
+    command = get_command(tmp_path, 'movie')
+    assert executor.status(command) is None
+
+    executor.add(command, str(tmp_path))
+    assert executor.status(command) in ['queued', 'running']
+    assert wait_for(executor, command, ['done', 'failed']) == 'done'
+    assert os.path.getsize(tmp_path / 'movie.x265.mkv') == 500
+
+    job = session.query(Job).one()
+    assert job.status == 'done'
+    assert job.returncode == 0
+    started, finished, user_time, system_time = executor.usage(command)
+    assert started <= finished
+    assert user_time is not None and system_time is not None
+
+    executor.remove(command)
+    assert executor.status(command) is None
+    assert session.query(Job).count() == 0
+
+
+def test_failed_job(session, fake_ffmpeg, tmp_path):
+    """A job with a non-zero exit code fails and keeps the tail of its stderr."""
+    executor = LocalExecutor(session, 1)
+    command = get_command(tmp_path, 'movie') + ' ; echo broken >&2; exit 3'
+
+    executor.add(command, str(tmp_path))
+    assert wait_for(executor, command, ['done', 'failed']) == 'failed'
+    job = session.query(Job).one()
+    assert job.returncode == 3
+    assert 'broken' in job.stderr
+
+
+def test_capacity(session, fake_ffmpeg, tmp_path, monkeypatch):
+    """Jobs don't occupy more slots than the capacity."""
+    monkeypatch.setenv('FAKE_FFMPEG_SLEEP', '30')
+    executor = LocalExecutor(session, 2)
+    first, second = get_command(tmp_path, 'first'), get_command(tmp_path, 'second')
+    executor.add(first, str(tmp_path), slots=2)
+    executor.add(second, str(tmp_path))
+
+    wait_for(executor, first, ['running'])
+    time.sleep(0.2)
+    executor.refresh()
+    assert executor.status(second) == 'queued'
+
+    executor.kill(first)
+    assert wait_for(executor, first, ['done', 'failed']) == 'failed'
+    wait_for(executor, second, ['running'])
+    executor.kill(second)
+    wait_for(executor, second, ['failed'])
+
+
+def test_kill(session, fake_ffmpeg, tmp_path, monkeypatch):
+    """Running and queued jobs are stopped."""
+    monkeypatch.setenv('FAKE_FFMPEG_SLEEP', '30')
+    executor = LocalExecutor(session, 1)
+    running, queued = get_command(tmp_path, 'running'), get_command(tmp_path, 'queued')
+    executor.add(running, str(tmp_path))
+    executor.add(queued, str(tmp_path))
+    wait_for(executor, running, ['running'])
+
+    executor.kill(queued)
+    assert wait_for(executor, queued, ['failed'], timeout=2) == 'failed'
+    assert executor.jobs[queued].stderr == 'Killed before start'
+
+    start = time.time()
+    executor.kill(running)
+    assert wait_for(executor, running, ['done', 'failed']) == 'failed'
+    assert time.time() - start < 10
+    assert not (tmp_path / 'queued.x265.mkv').exists()
+
+
+def test_resume(session, fake_ffmpeg, tmp_path, monkeypatch):
+    """Running jobs of a previous run are picked up again by their pid, queued jobs are forgotten."""
+    monkeypatch.setenv('FAKE_FFMPEG_SLEEP', '30')
+    previous = LocalExecutor(session, 1)
+    running, queued = get_command(tmp_path, 'running'), get_command(tmp_path, 'queued')
+    previous.add(running, str(tmp_path))
+    previous.add(queued, str(tmp_path))
+    wait_for(previous, running, ['running'])
+    pid = previous.jobs[running].pid
+
+    # A new executor of the same database, as after a restart of encarne.
+    executor = LocalExecutor(session, 1)
+    assert executor.status(running) == 'running'
+    assert executor.status(queued) is None
+    assert session.query(Job).filter(Job.command == queued).count() == 0
+
+    executor.kill(running)
+    assert executor.status(running) == 'failed'
+    deadline = time.time() + 10
+    while is_alive(pid) and time.time() < deadline:
+        time.sleep(0.1)
+    assert not is_alive(pid)
+
+
+def test_restart_while_running(session, fake_ffmpeg, tmp_path, monkeypatch):
+    """A started job is persisted by waiting alone, so a crash right after the start doesn't lose it."""
+    monkeypatch.setenv('FAKE_FFMPEG_SLEEP', '30')
+    previous = LocalExecutor(session, 1)
+    command = get_command(tmp_path, 'movie')
+    previous.add(command, str(tmp_path))
+    assert previous.wait([], 10)
+
+    # Encarne is killed without any further refresh.
+    session.expunge_all()
+    job = session.query(Job).one()
+    assert job.status == 'running'
+    assert is_alive(job.pid)
+
+    executor = LocalExecutor(session, 1)
+    assert executor.status(command) == 'running'
+    assert executor.jobs[command].pid == job.pid
+    executor.kill(command)
+
+
+def test_resumed_job_finishes(session, fake_ffmpeg, tmp_path, monkeypatch):
+    """A resumed job is done, once its process is gone."""
+    monkeypatch.setenv('FAKE_FFMPEG_SLEEP', '1')
+    previous = LocalExecutor(session, 1)
+    command = get_command(tmp_path, 'movie')
+    previous.add(command, str(tmp_path))
+    wait_for(previous, command, ['running'])
+
+    executor = LocalExecutor(session, 1)
+    assert executor.status(command) == 'running'
+    assert wait_for(executor, command, ['done', 'failed']) == 'done'
+
+
+def test_lost_orphan(session, fake_ffmpeg, tmp_path, monkeypatch):
+    """A resumed job, which is gone without finishing its progress file, is forgotten."""
+    monkeypatch.setenv('FAKE_FFMPEG_SLEEP', '30')
+    previous = LocalExecutor(session, 1)
+    command = get_command(tmp_path, 'movie')
+    previous.add(command, str(tmp_path))
+    wait_for(previous, command, ['running'])
+    pid = previous.jobs[command].pid
+
+    executor = LocalExecutor(session, 1)
+    assert executor.status(command) == 'running'
+    # The process dies, e.g. by a reboot.
+    os.killpg(pid, signal.SIGKILL)
+    deadline = time.time() + 10
+    while is_alive(pid) and time.time() < deadline:
+        time.sleep(0.1)
+
+    executor.refresh()
+    assert executor.status(command) is None
+    assert session.query(Job).count() == 0
+
+
+def test_process_start():
+    """A process is identified by its pid and start time."""
+    process_start = get_process_start(os.getpid())
+    assert process_start is not None
+    assert is_same_process(os.getpid(), process_start)
+    assert is_same_process(os.getpid(), None)
+    assert not is_same_process(os.getpid(), process_start + '0')
+
+
+def add_previous_job(session, tmp_path, pid, process_start, progress=None):
+    """Add a running job of a previous run."""
+    command = get_command(tmp_path, 'movie')
+    if progress is not None:
+        with open(tmp_path / 'movie.progress', 'w') as progress_file:
+            progress_file.write(progress)
+    job = Job(command, str(tmp_path))
+    job.status = 'running'
+    job.pid = pid
+    job.process_start = process_start
+    session.add(job)
+    session.commit()
+    return command
+
+
+def get_dead_pid():
+    """Get the pid of a process, which is gone."""
+    process = subprocess.Popen(['true'])
+    process.wait()
+    return process.pid
+
+
+def test_resume_reused_pid(session, tmp_path):
+    """A job isn't resumed, if its pid belongs to another process, e.g. after a reboot."""
+    command = add_previous_job(session, tmp_path, os.getpid(), 'another-boot:1', 'frame=10\nprogress=continue\n')
+
+    executor = LocalExecutor(session, 1)
+    assert executor.status(command) is None
+    assert executor.orphans == {}
+    assert session.query(Job).count() == 0
+
+
+def test_resume_finished_process(session, tmp_path):
+    """A job, whose process finished while encarne wasn't running, is done, if its progress file has been finished."""
+    command = add_previous_job(session, tmp_path, get_dead_pid(), None, 'frame=10\nprogress=end\n')
+
+    executor = LocalExecutor(session, 1)
+    assert executor.status(command) == 'done'
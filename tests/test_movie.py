@@ -0,0 +1,98 @@
+"""Tests of the movie index."""
+import os
+import shutil
+
+from encarne.movie import Movie, MovieIndex
+from encarne.media import get_fingerprint, get_sha1
+
+from conftest import create_file
+
+
+def index_file(session, path):
+    """Get or create the movie of a file with a new index, like a scan does."""
+    movies = MovieIndex(session)
+    movie = movies.get_or_create(os.path.basename(path), os.path.dirname(path), os.path.getsize(path))
+    movies.commit()
+    return movie
+
+
+def get_movies(session):
+    """Get all movies by their path."""
+    return {os.path.join(movie.directory, movie.name): movie for movie in session.query(Movie).all()}
+
+
+def test_new_movie(session, tmp_path):
+    """An unknown file creates a new movie with its fingerprint."""
+    path = create_file(str(tmp_path / 'a.mkv'))
+    movie = index_file(session, path)
+
+    assert movie.fingerprint == get_fingerprint(path)
+    assert movie.size == movie.original_size == 1024
+    assert list(get_movies(session)) == [path]
+
+
+def test_moved_movie(session, tmp_path):
+    """A moved file is recognized by its fingerprint and keeps its movie."""
+    path = create_file(str(tmp_path / 'a.mkv'))
+    index_file(session, path).encoded = True
+    session.commit()
+
+    moved_path = str(tmp_path / 'other' / 'a.mkv')
+    os.makedirs(os.path.dirname(moved_path))
+    shutil.move(path, moved_path)
+    index_file(session, moved_path)
+
+    movies = get_movies(session)
+    assert list(movies) == [moved_path]
+    assert movies[moved_path].encoded
+
+
+def test_same_fingerprint_is_confirmed_by_sha1(session, tmp_path):
+    """Of multiple movies with the same fingerprint, the one with the matching sha1 is picked."""
+    path = create_file(str(tmp_path / 'moved.mkv'))
+    fingerprint = get_fingerprint(path)
+    session.add(Movie('0' * 40, 'first.mkv', '/old', 1024, fingerprint=fingerprint))
+    session.add(Movie(get_sha1(path), 'second.mkv', '/old', 1024, fingerprint=fingerprint))
+    session.commit()
+
+    movie = index_file(session, path)
+
+    assert movie.sha1 == get_sha1(path)
+    assert sorted(get_movies(session)) == ['/old/first.mkv', path]
+
+
+def test_movie_moved_over_known_path(session, tmp_path):
+    """A movie, which is moved over another known movie, replaces it."""
+    first = create_file(str(tmp_path / 'a.mkv'), size=1024)
+    second = create_file(str(tmp_path / 'b.mkv'), size=2048)
+    index_file(session, first)
+    index_file(session, second).encoded = True
+    session.commit()
+
+    shutil.move(second, first)
+    index_file(session, first)
+
+    movies = get_movies(session)
+    assert list(movies) == [first]
+    assert movies[first].size == 2048
+    assert movies[first].encoded
+
+
+def test_new_release_at_same_path(session, tmp_path):
+    """A new file at a known path gets a new movie, which doesn't inherit any flags."""
+    path = create_file(str(tmp_path / 'a.mkv'), size=1024)
+    movie = index_file(session, path)
+    movie.failed = True
+    movie.encoded = True
+    movie.predicted_ratio = 0.95
+    session.commit()
+
+    create_file(path, size=2048)
+    index_file(session, path)
+    session.remove()
+
+    movie = get_movies(session)[path]
+    assert movie.size == movie.original_size == 2048
+    assert not movie.failed
+    assert not movie.encoded
+    assert movie.predicted_ratio is None
@@ -0,0 +1,80 @@
+"""Tests of the detection of the cgroup cpu quota."""
+import os
+
+from encarne.planner import get_cgroup_quota
+
+
+def write(path, content):
+    """Write a file and create its directory."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def create_proc(tmp_path, cgroups, mounts):
+    """Create the cgroup and mountinfo files of a process."""
+    proc_dir = str(tmp_path / 'proc')
+    write(os.path.join(proc_dir, 'cgroup'), ''.join(f'{line}\n' for line in cgroups))
+    lines = [
+        f'{index + 30} 24 0:{index + 28} {root} {mount} rw,relatime - {filesystem} {filesystem} {options}\n'
+        for index, (root, mount, filesystem, options) in enumerate(mounts)
+    ]
+    write(os.path.join(proc_dir, 'mountinfo'), ''.join(lines))
+    return proc_dir
+
+
+def test_cgroup_v2(tmp_path):
+    """The quota of the process's own cgroup is found below the root."""
+    mount = str(tmp_path / 'cgroup')
+    proc_dir = create_proc(tmp_path, ['0::/system.slice/encarne.service'], [('/', mount, 'cgroup2', 'rw')])
+    write(os.path.join(mount, 'cpu.max'), 'max 100000\n')
+    write(os.path.join(mount, 'system.slice', 'cpu.max'), 'max 100000\n')
+    write(os.path.join(mount, 'system.slice', 'encarne.service', 'cpu.max'), '250000 100000\n')
+
+    assert get_cgroup_quota(proc_dir) == 2.5
+
+
+def test_cgroup_v2_parent(tmp_path):
+    """The quota of a parent, e.g. a slice, limits its children."""
+    mount = str(tmp_path / 'cgroup')
+    proc_dir = create_proc(tmp_path, ['0::/encarne.slice/encarne.service'], [('/', mount, 'cgroup2', 'rw')])
+    write(os.path.join(mount, 'encarne.slice', 'cpu.max'), '150000 100000\n')
+    write(os.path.join(mount, 'encarne.slice', 'encarne.service', 'cpu.max'), '400000 100000\n')
+
+    assert get_cgroup_quota(proc_dir) == 1.5
+
+
+def test_cgroup_v1(tmp_path):
+    """The cpu controller of cgroup v1 has its own hierarchy."""
+    mount = str(tmp_path / 'cgroup' / 'cpu,cpuacct')
+    proc_dir = create_proc(
+        tmp_path,
+        ['5:memory:/other', '4:cpu,cpuacct:/system.slice/encarne.service'],
+        [('/', str(tmp_path / 'cgroup' / 'memory'), 'cgroup', 'rw,memory'), ('/', mount, 'cgroup', 'rw,cpu,cpuacct')],
+    )
+    service = os.path.join(mount, 'system.slice', 'encarne.service')
+    write(os.path.join(service, 'cpu.cfs_quota_us'), '300000\n')
+    write(os.path.join(service, 'cpu.cfs_period_us'), '100000\n')
+    write(os.path.join(mount, 'cpu.cfs_quota_us'), '-1\n')
+    write(os.path.join(mount, 'cpu.cfs_period_us'), '100000\n')
+
+    assert get_cgroup_quota(proc_dir) == 3
+
+
+def test_container(tmp_path):
+    """A mount of a subtree, as in a container, is resolved relative to its root."""
+    mount = str(tmp_path / 'cgroup')
+    proc_dir = create_proc(tmp_path, ['0::/docker/abc'], [('/docker/abc', mount, 'cgroup2', 'rw')])
+    write(os.path.join(mount, 'cpu.max'), '200000 100000\n')
+
+    assert get_cgroup_quota(proc_dir) == 2
+
+
+def test_no_quota(tmp_path):
+    """Without any quota or cgroup, the cpus aren't limited."""
+    mount = str(tmp_path / 'cgroup')
+    proc_dir = create_proc(tmp_path, ['0::/user.slice'], [('/', mount, 'cgroup2', 'rw')])
+    write(os.path.join(mount, 'user.slice', 'cpu.max'), 'max 100000\n')
+
+    assert get_cgroup_quota(proc_dir) is None
+    assert get_cgroup_quota(str(tmp_path / 'missing')) is None
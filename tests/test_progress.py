@@ -0,0 +1,77 @@
+"""Tests of the parsing of ffmpeg's progress output."""
+from encarne.progress import (
+    read_progress,
+    is_finished,
+    get_out_time,
+    get_frames,
+    get_total_size,
+    get_speed,
+    get_remaining_time,
+)
+
+BLOCK = 'frame={frame}\nfps=25.0\ntotal_size={size}\nout_time_us={time}\nspeed={speed}\nprogress={state}\n'
+
+
+def write(path, content):
+    """Write a progress file."""
+    with open(path, 'w') as progress_file:
+        progress_file.write(content)
+    return str(path)
+
+
+def test_missing_file():
+    """A missing progress file has no progress."""
+    assert read_progress('/nonexistent/progress') is None
+    assert not is_finished(None)
+    assert get_out_time(None) is None
+    assert get_remaining_time(None, 100) is None
+
+
+def test_last_complete_block(tmp_path):
+    """Only the last complete block is used, a partially written one is ignored."""
+    content = BLOCK.format(frame=10, size=1000, time=2000000, speed='2.0x', state='continue') \
+        + BLOCK.format(frame=20, size=2000, time=4000000, speed='4.0x', state='continue') \
+        + 'frame=30\nfps=25.0\n'
+    progress = read_progress(write(tmp_path / 'progress', content))
+
+    assert get_frames(progress) == 20
+    assert get_total_size(progress) == 2000
+    assert get_out_time(progress) == 4
+    assert get_speed(progress) == 4
+    assert not is_finished(progress)
+    assert get_remaining_time(progress, 20) == 4
+
+
+def test_incomplete_first_block(tmp_path):
+    """A file without any complete block has no progress."""
+    assert read_progress(write(tmp_path / 'progress', 'frame=1\nfps=25.0\n')) is None
+
+
+def test_finished(tmp_path):
+    """The last block of a finished encode ends with `progress=end`."""
+    content = BLOCK.format(frame=10, size=1000, time=2000000, speed='2.0x', state='continue') \
+        + BLOCK.format(frame=20, size=0, time=4000000, speed='4.0x', state='end')
+    progress = read_progress(write(tmp_path / 'progress', content))
+
+    assert is_finished(progress)
+    assert get_remaining_time(progress, 2) == 0
+
+
+def test_long_file(tmp_path):
+    """Only the tail of a long progress file is read."""
+    content = ''.join(BLOCK.format(frame=index, size=index, time=index, speed='1.0x', state='continue')
+                      for index in range(1000))
+    progress = read_progress(write(tmp_path / 'progress', content))
+    assert get_frames(progress) == 999
+
+
+def test_unknown_values(tmp_path):
+    """Values, which ffmpeg doesn't know yet, are `None`."""
+    content = 'frame=0\nout_time_us=N/A\nspeed=N/A\nprogress=continue\n'
+    progress = read_progress(write(tmp_path / 'progress', content))
+
+    assert get_frames(progress) == 0
+    assert get_out_time(progress) is None
+    assert get_speed(progress) is None
+    assert get_total_size(progress) is None
+    assert get_remaining_time(progress, 100) is None
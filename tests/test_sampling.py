@@ -0,0 +1,43 @@
+"""Tests of the prediction by samples."""
+import configparser
+from datetime import timedelta
+
+from encarne.encoder import Encoder
+from encarne.media import MediaProbe
+from encarne.sampling import predict_ratio
+from encarne.task import Task
+
+from conftest import create_file
+
+
+def get_config():
+    """Get the default config with two samples."""
+    config = configparser.ConfigParser()
+    config.read_dict(Encoder.default_config(None))
+    config['encoding']['samples'] = '2'
+    return config
+
+
+def test_samples_are_cut_from_the_original(fake_ffmpeg, tmp_path):
+    """A staged source, which doesn't exist yet, doesn't prevent the prediction."""
+    config = get_config()
+    path = create_file(str(tmp_path / 'library' / 'movie.mkv'), size=100000)
+    probe = MediaProbe(codec='AVC', duration=timedelta(seconds=100))
+    task = Task(path, config, probe, scratch_dir=str(tmp_path / 'scratch'),
+                source_path=str(tmp_path / 'staging' / 'movie.mkv'))
+
+    ratio = predict_ratio(task, config)
+    assert ratio is not None
+    assert 0 < ratio < 1
+
+
+def test_new_scratch_dir(fake_ffmpeg, tmp_path):
+    """The scratch directory is created for the samples, if it doesn't exist yet."""
+    config = get_config()
+    path = create_file(str(tmp_path / 'library' / 'movie.mkv'), size=100000)
+    probe = MediaProbe(codec='AVC', duration=timedelta(seconds=100))
+    task = Task(path, config, probe, scratch_dir=str(tmp_path / 'new' / 'scratch'))
+
+    ratio = predict_ratio(task, config)
+    assert ratio is not None
+    assert 0 < ratio < 1
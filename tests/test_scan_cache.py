@@ -0,0 +1,59 @@
+"""Tests of the pruning of the scan cache."""
+import os
+
+from encarne.scan_cache import ScanEntry
+
+from conftest import create_file
+
+
+def add_entry(session, path):
+    """Add the entry of an existing file."""
+    entry = ScanEntry(os.stat(path), path)
+    session.add(entry)
+    session.commit()
+    return entry
+
+
+def get_paths(session):
+    """Get the paths of all entries."""
+    return sorted(path for (path,) in session.query(ScanEntry.path))
+
+
+def test_clean(session, tmp_path):
+    """Entries of deleted and replaced files are removed, current ones are kept."""
+    kept = create_file(str(tmp_path / 'library' / 'kept.mkv'))
+    deleted = create_file(str(tmp_path / 'library' / 'deleted.mkv'))
+    replaced = create_file(str(tmp_path / 'library' / 'replaced.mkv'))
+    for path in [kept, deleted, replaced]:
+        add_entry(session, path)
+
+    # An encoded movie replaces the original with a new inode.
+    encoded = create_file(str(tmp_path / 'library' / 'encoded.mkv'))
+    os.replace(encoded, replaced)
+    os.remove(deleted)
+    add_entry(session, replaced)
+
+    assert ScanEntry.clean(session) == 2
+    assert get_paths(session) == [kept, replaced]
+    assert session.query(ScanEntry).filter(ScanEntry.inode == os.stat(replaced).st_ino).count() == 1
+
+
+def test_clean_missing_directory(session, tmp_path):
+    """All entries below a removed directory are removed."""
+    # Wildcards of the removed directory's name don't match other directories.
+    kept = create_file(str(tmp_path / 'library' / 'aXb' / 'kept.mkv'))
+    paths = [
+        create_file(str(tmp_path / 'library' / 'a_b' / 'first.mkv')),
+        create_file(str(tmp_path / 'library' / 'a_b' / 'second.mkv')),
+        create_file(str(tmp_path / 'library' / 'a_b' / 'extras' / 'third.mkv')),
+    ]
+    for path in [kept] + paths:
+        add_entry(session, path)
+
+    for path in paths:
+        os.remove(path)
+    os.rmdir(tmp_path / 'library' / 'a_b' / 'extras')
+    os.rmdir(tmp_path / 'library' / 'a_b')
+
+    assert ScanEntry.clean(session) == 3
+    assert get_paths(session) == [kept]
@@ -0,0 +1,78 @@
+"""Tests of the statistics."""
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from encarne.db import engine
+from encarne.encode_run import EncodeRun
+from encarne.movie import Movie
+from encarne.scan_cache import ScanEntry
+from encarne.stats import get_stats, show_stats
+
+
+def add_movie(session, name, original_size, size, encoded=False, failed=False):
+    """Add a movie in `/library`."""
+    movie = Movie(None, name, '/library', original_size)
+    movie.size = size
+    movie.encoded = encoded
+    movie.failed = failed
+    session.add(movie)
+
+
+def add_entry(session, name, inode, size, mtime_ns, codec):
+    """Add a scan cache entry of a file in `/library`."""
+    stat = SimpleNamespace(st_dev=1, st_ino=inode, st_size=size, st_mtime_ns=mtime_ns)
+    entry = ScanEntry(stat, f'/library/{name}')
+    entry.codec = codec
+    session.add(entry)
+
+
+def test_reencoded_movies(session):
+    """Only movies, which shrank by encoding, are counted as reencoded."""
+    add_movie(session, 'reencoded.mkv', 2000, 1000, encoded=True)
+    add_movie(session, 'already-hevc.mkv', 2000, 2000, encoded=True)
+    add_movie(session, 'failed.mkv', 2000, 2000, failed=True)
+    add_movie(session, 'pending.mkv', 2000, 2000)
+    session.commit()
+
+    stats = get_stats(session)
+    assert stats['movies'] == 4
+    assert stats['reencoded'] == 1
+    assert stats['saved'] == 1000
+    assert stats['status']['encoded']['movies'] == 2
+    assert stats['status']['encoded']['reencoded'] == 1
+
+
+def test_codec_of_current_file(session):
+    """The codec is taken from the entry of the current file, not from the one of the replaced original."""
+    add_movie(session, 'movie.mkv', 2000, 1000, encoded=True)
+    add_entry(session, 'movie.mkv', 1, 2000, 1, 'AVC')
+    add_entry(session, 'movie.mkv', 2, 1000, 2, 'HEVC')
+    session.commit()
+
+    assert list(get_stats(session)['codec']) == ['HEVC']
+
+
+def test_show_stats(session, capsys):
+    """The statistics are printed as JSON."""
+    add_movie(session, 'reencoded.mkv', 2000, 1000, encoded=True)
+    session.commit()
+
+    show_stats({'check_files': False, 'by_directory': False, 'json': True})
+    stats = json.loads(capsys.readouterr().out)
+    assert stats['saved'] == 1000
+
+
+def test_show_stats_outdated_database(session):
+    """An outdated database isn't migrated by `encarne stat`, which may not be able to write it."""
+    EncodeRun.__table__.drop(engine)
+
+    with pytest.raises(SystemExit):
+        show_stats({'check_files': False, 'by_directory': False, 'json': True})
+    assert not engine.has_table(EncodeRun.__tablename__)
+
+
+def test_write_ahead_log(session):
+    """Commands, which write to the database, switch it to the write-ahead log."""
+    assert engine.execute('PRAGMA journal_mode').scalar() == 'wal'
@@ -0,0 +1,82 @@
+"""Tests of the library traversal."""
+import os
+import time
+
+from encarne.walker import LibraryWalker
+
+from conftest import create_file
+
+
+def create_library(root):
+    """Create a small library, whose directories didn't change for a while."""
+    for path in ['a/one.mkv', 'a/two.MP4', 'a/notes.txt', 'b/c/three.avi', '.hidden/four.mkv',
+                 '@eaDir/five.mkv', 'samples/six.mkv']:
+        create_file(os.path.join(root, path), size=10)
+    age_directories(root)
+
+
+def age_directories(root):
+    """Move the mtime of all directories into the past, so their listings are remembered."""
+    past = time.time() - 3600
+    for directory, _, _ in os.walk(root):
+        os.utime(directory, (past, past))
+
+
+def walk(root, listings=None):
+    """Walk a library and get the walker and all found paths relative to the root."""
+    walker = LibraryWalker(['mkv', 'mp4', 'avi'], excludes=['samples'], listings=listings)
+    paths = sorted(os.path.relpath(path, root) for path in walker.walk(root))
+    return walker, paths
+
+
+def test_filters(tmp_path):
+    """Only video containers are found, hidden, metadata and excluded directories are skipped."""
+    root = str(tmp_path)
+    create_library(root)
+
+    walker, paths = walk(root)
+    assert paths == ['a/one.mkv', 'a/two.MP4', 'b/c/three.avi']
+    assert walker.listed == 4
+
+
+def test_unchanged_directories_are_not_listed(tmp_path):
+    """The remembered listings of unchanged directories are used, changed ones are listed again."""
+    root = str(tmp_path)
+    create_library(root)
+    first, _ = walk(root)
+
+    walker, paths = walk(root, first.visited)
+    assert paths == ['a/one.mkv', 'a/two.MP4', 'b/c/three.avi']
+    assert walker.listed == 0
+
+    create_file(os.path.join(root, 'b', 'new.mkv'), size=10)
+    os.utime(os.path.join(root, 'b'), (time.time() - 60, time.time() - 60))
+    walker, paths = walk(root, walker.visited)
+    assert paths == ['a/one.mkv', 'a/two.MP4', 'b/c/three.avi', 'b/new.mkv']
+    assert walker.listed == 1
+
+
+def test_recently_changed_directories_are_not_remembered(tmp_path):
+    """Changes within the mtime granularity could be missed, such directories are always listed."""
+    root = str(tmp_path)
+    create_library(root)
+    create_file(os.path.join(root, 'a', 'new.mkv'), size=10)
+
+    first, _ = walk(root)
+    assert first.visited[os.path.join(root, 'a')][0] is None
+
+    walker, _ = walk(root, first.visited)
+    assert walker.listed == 1
+
+
+def test_removed_directory(tmp_path):
+    """A directory, which has been removed since the last walk, is skipped."""
+    root = str(tmp_path)
+    create_library(root)
+    first, _ = walk(root)
+
+    for name in os.listdir(os.path.join(root, 'b', 'c')):
+        os.remove(os.path.join(root, 'b', 'c', name))
+    os.rmdir(os.path.join(root, 'b', 'c'))
+    walker, paths = walk(root, first.visited)
+    assert paths == ['a/one.mkv', 'a/two.MP4']
@@ -0,0 +1,59 @@
+"""Tests of the completion watcher."""
+from encarne.watcher import CompletionWatcher
+
+
+class FakeTask():
+    """A task with a fixed list of progress files."""
+
+    def __init__(self, paths):
+        """Create a new task."""
+        self.progress_files = [(path, 60) for path in paths]
+
+
+def write_progress(path, state):
+    """Write a single ffmpeg progress block."""
+    with open(path, 'w') as progress_file:
+        progress_file.write(f'frame=10\nout_time_us=1000000\nprogress={state}\n')
+
+
+def test_finished_segment_is_reported_once(tmp_path):
+    """A finished segment wakes the watcher once, not for as long as the other segments run."""
+    first, second = str(tmp_path / 'first.progress'), str(tmp_path / 'second.progress')
+    task = FakeTask([first, second])
+    watcher = CompletionWatcher(str(tmp_path / 'queue'))
+    write_progress(first, 'continue')
+    write_progress(second, 'continue')
+    assert not watcher.poll([task])
+
+    write_progress(first, 'end')
+    assert watcher.poll([task])
+    assert not watcher.poll([task])
+    assert not watcher.wait([task], 0)
+
+    write_progress(second, 'end')
+    assert watcher.poll([task])
+    assert not watcher.poll([task])
+
+
+def test_restarted_segment_is_reported_again(tmp_path):
+    """A segment, which is encoded again, is reported, once it finished again."""
+    path = str(tmp_path / 'segment.progress')
+    task = FakeTask([path])
+    watcher = CompletionWatcher(str(tmp_path / 'queue'))
+    write_progress(path, 'end')
+    assert watcher.poll([task])
+
+    write_progress(path, 'continue')
+    assert not watcher.poll([task])
+    write_progress(path, 'end')
+    assert watcher.poll([task])
+
+
+def test_queue_change_is_reported(tmp_path):
+    """A rewritten pueue queue file wakes the watcher."""
+    queue = tmp_path / 'queue'
+    watcher = CompletionWatcher(str(queue))
+    assert not watcher.poll([])
+    queue.write_text('{}')
+    assert watcher.poll([])
+    assert not watcher.poll([])